@@ -3,6 +3,8 @@ import shutil
 
 import cv2
 
+from image_stitching.cache import FeatureCache
+
 
 # rescale the images
 def rescale(img):
@@ -27,13 +29,17 @@ counter = 0
 orb = cv2.ORB.create()
 bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
 
+# cache the orb features between runs on the same video
+cache = FeatureCache("feature_cache")
+config = f"orb opencv {cv2.__version__}"
+
 # store the first frame
 _, last = cap.read()
 last = rescale(last)
 cv2.imwrite(folder + str(counter).zfill(5) + ".png", last)
 
 # get the first frame's stuff
-kp1, des1 = orb.detectAndCompute(last, None)
+kp1, des1 = cache.detect_and_compute(orb, last, config)
 
 # cutoff, the minimum number of keypoints
 cutoff = 50
@@ -51,7 +57,7 @@ while True:
     frame = rescale(frame)
 
     # count keypoints
-    kp2, des2 = orb.detectAndCompute(frame, None)
+    kp2, des2 = cache.detect_and_compute(orb, frame, config)
 
     # match
     matches = bf.knnMatch(des1, des2, k=2)
@@ -1,6 +1,7 @@
 from .stitcher import ImageStitcher
 from .helpers import display
 from .helpers import load_frames
+from .helpers import stream_frames
 
 DOC = """
     image_stitching is based around the ImageStitcher class which handles all
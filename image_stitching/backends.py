@@ -0,0 +1,125 @@
+import cv2
+import numpy
+
+from .cache import descriptors
+from .features import keypoint_coords
+
+DOC = """feature detectors paired with the matcher suited to their descriptors"""
+
+FEATURES = ("sift", "orb", "akaze", "brisk")
+MATCHERS = ("flann", "bf")
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+def create_detector(name: str):
+    """
+    creates the cv2 feature detector, AKAZE and BRISK live in xfeatures2d
+    on some opencv builds so both places are tried
+    """
+    assert name in FEATURES, f"features must be one of {FEATURES}"
+    class_name = name.upper()
+
+    detector_class = getattr(cv2, class_name, None)
+    if detector_class is not None:
+        return detector_class.create()
+
+    contrib = getattr(cv2, "xfeatures2d", None)
+    factory = getattr(contrib, f"{class_name}_create", None)
+    assert factory is not None, f"this opencv build has no {class_name}"
+    return factory()
+
+
+def _neighbours(indices, distances):
+    """
+    tidies k-nearest neighbour results into float32 distances and int indices,
+    missing neighbours get an infinite distance, combine.ratio_filter drops any
+    query whose second distance is not finite
+    """
+    indices = numpy.asarray(indices, dtype=numpy.int64)
+    distances = numpy.asarray(distances, dtype=numpy.float32).copy()
+    distances[indices < 0] = numpy.inf
+    return distances, numpy.maximum(indices, 0)
+
+
+class FlannMatcher:
+    DOC = (
+        """FLANN k-nearest neighbour search returning arrays rather than DMatch lists"""
+    )
+
+    def __init__(self, index_params: dict, search_params: dict):
+        """constructor that keeps the index and search parameters"""
+        self.index_params = index_params
+        self.search_params = search_params
+        self.squared = index_params["algorithm"] != FLANN_INDEX_LSH
+
+    def build(self, train):
+        """builds a cv2.flann_Index over the train descriptors"""
+        return cv2.flann_Index(train, self.index_params)
+
+    def search(self, index, query, k: int):
+        """
+        returns (distances, indices) of shape (len(query), k) from a built index,
+        the KD-tree reports squared L2 so it is square rooted to match cv2 norms
+        """
+        indices, distances = index.knnSearch(query, k, params=self.search_params)
+        distances, indices = _neighbours(indices, distances)
+        if self.squared:
+            numpy.sqrt(distances, out=distances)
+        return distances, indices
+
+    def knn_search(self, query, train, k: int):
+        """returns (distances, indices) of the k nearest train rows to each query row"""
+        return self.search(self.build(train), query, k)
+
+
+def create_matcher(binary: bool, matcher: str = "flann"):
+    """
+    flann uses a KD-tree for float descriptors and LSH for binary ones,
+    bf is a brute force matcher with the L2 or Hamming norm
+    """
+    assert matcher in MATCHERS, f"matcher must be one of {MATCHERS}"
+
+    if matcher == "bf":
+        return cv2.BFMatcher(cv2.NORM_HAMMING if binary else cv2.NORM_L2)
+
+    if binary:
+        index_params = {
+            "algorithm": FLANN_INDEX_LSH,
+            "table_number": 6,
+            "key_size": 12,
+            "multi_probe_level": 1,
+        }
+    else:
+        index_params = {"algorithm": FLANN_INDEX_KDTREE, "trees": 5}
+    return FlannMatcher(index_params, {"checks": 50})
+
+
+class FeatureBackend:
+    DOC = """a feature detector and the matcher for its descriptor type"""
+
+    def __init__(self, features: str = "sift", matcher: str = "flann", cache=None):
+        """
+        constructor that creates the detector and its matcher, cache is a
+        cache.FeatureCache that detections are loaded from and stored to
+        """
+        self.features = features
+        self.matcher_type = matcher
+        self.binary = features != "sift"
+        self.detector = create_detector(features)
+        self.matcher = create_matcher(self.binary, matcher)
+        self.cache = cache
+        self.config = f"{features} opencv {cv2.__version__}"
+
+    def clone(self):
+        """a new backend with the same configuration, detectors are not thread safe"""
+        return FeatureBackend(self.features, self.matcher_type, self.cache)
+
+    def detect(self, image_gray):
+        """returns (points, descriptors) of the gray image"""
+        if self.cache is not None:
+            arrays = self.cache.detect(self.detector, image_gray, self.config)
+            return arrays["points"], descriptors(arrays)
+        keypoints, image_descriptors = self.detector.detectAndCompute(image_gray, None)
+        return keypoint_coords(keypoints), image_descriptors
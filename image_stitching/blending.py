@@ -0,0 +1,239 @@
+import logging
+
+import cv2
+import numpy
+
+from .seams import SEAM_FINDERS, SEAMS, seam_distances
+
+DOC = """
+    blending of a new frame into what is already on the canvas, only the bounding box
+    of their overlap is blended so the cost follows the overlap rather than the canvas
+"""
+
+BLENDS = (None, "feather", "multiband")
+
+
+def coverage(image: numpy.ndarray):
+    """
+    pixels something was drawn to, the canvases leave everything else black so
+    this is only a fallback for when the footprints of earlier frames are not known
+    """
+    return image.any(axis=-1)
+
+
+def footprint_mask(footprints, x_min: int, y_min: int, shape):
+    """
+    pixels of the region at (x_min, y_min) covered by earlier frames, given as the
+    warped corners of each frame. the outline is eroded by a pixel so every pixel
+    marked was really drawn to by the frame's nearest neighbour warp
+    """
+    height, width = shape[:2]
+    mask = numpy.zeros((height + 2, width + 2), dtype=numpy.uint8)
+    if len(footprints) == 0:
+        return mask[1:-1, 1:-1] > 0
+
+    quads = numpy.asarray(footprints, dtype=numpy.float64).reshape(-1, 4, 2)
+    quads = quads - (x_min - 1, y_min - 1)
+    low, high = quads.min(axis=1), quads.max(axis=1)
+    hits = (high[:, 0] >= 0) & (high[:, 1] >= 0)
+    hits &= (low[:, 0] < width + 2) & (low[:, 1] < height + 2)
+    for quad in quads[hits]:
+        cv2.fillConvexPoly(mask, numpy.round(quad * 16).astype(numpy.int32), 1, shift=4)
+
+    mask = cv2.erode(mask, numpy.ones((3, 3), dtype=numpy.uint8))
+    return mask[1:-1, 1:-1] > 0
+
+
+def overlap_roi(base_mask, patch_mask):
+    """
+    returns (rows, cols) slices of the overlap's bounding box grown by a pixel, so
+    the edges of both masks are inside it, or None if they do not overlap
+    """
+    overlap = (base_mask & patch_mask).astype(numpy.uint8)
+    x, y, w, h = cv2.boundingRect(overlap)
+    if w == 0 or h == 0:
+        return None
+    height, width = overlap.shape
+    return (
+        slice(max(y - 1, 0), min(y + h + 1, height)),
+        slice(max(x - 1, 0), min(x + w + 1, width)),
+    )
+
+
+def _distances(base_mask, patch_mask, clipped):
+    """
+    distance of every pixel to the edge of each mask. cv2 treats pixels outside the
+    image as inside the mask, which holds for the canvas beyond the roi but not for
+    the frame beyond its own bounding box, so those sides are padded with zeros
+    """
+    top, bottom, left, right = clipped
+    padded = cv2.copyMakeBorder(
+        patch_mask.astype(numpy.uint8), top, bottom, left, right, cv2.BORDER_CONSTANT
+    )
+    height, width = patch_mask.shape
+    patch_distance = cv2.distanceTransform(padded, cv2.DIST_L2, 3)
+    patch_distance = patch_distance[top : top + height, left : left + width]
+    base_distance = cv2.distanceTransform(base_mask.astype(numpy.uint8), cv2.DIST_L2, 3)
+
+    limit = float(height + width)
+    return numpy.minimum(base_distance, limit), numpy.minimum(patch_distance, limit)
+
+
+def feather(base, patch, base_distance, patch_distance):
+    """weights each image by how far the pixel is from its edge"""
+    alpha = patch_distance / numpy.maximum(patch_distance + base_distance, 1e-6)
+    alpha = alpha[..., None]
+    blended = alpha * patch.astype(numpy.float32) + (1 - alpha) * base
+    return numpy.clip(blended + 0.5, 0, 255).astype(numpy.uint8)
+
+
+def pyramid_levels(shape, max_levels: int = 6):
+    """bands to blend over, fewer for a thin overlap so the coarsest is still 8px"""
+    return int(numpy.clip(numpy.log2(max(min(shape[:2]), 1)) - 3, 1, max_levels))
+
+
+def _laplacian_pyramid(image, levels):
+    gaussian = [image]
+    for _ in range(levels):
+        gaussian.append(cv2.pyrDown(gaussian[-1]))
+
+    pyramid = []
+    for fine, coarse in zip(gaussian[:-1], gaussian[1:]):
+        size = (fine.shape[1], fine.shape[0])
+        pyramid.append(fine - cv2.pyrUp(coarse, dstsize=size))
+    pyramid.append(gaussian[-1])
+    return pyramid
+
+
+def multiband(base, patch, base_distance, patch_distance, levels: int = None):
+    """
+    splits both images into laplacian bands and joins each band across the seam
+    where the images' edge distances are equal, smoothed at the band's own scale
+    """
+    levels = pyramid_levels(base.shape) if levels is None else levels
+    alpha = (patch_distance > base_distance).astype(numpy.float32)
+
+    base_bands = _laplacian_pyramid(base.astype(numpy.float32), levels)
+    patch_bands = _laplacian_pyramid(patch.astype(numpy.float32), levels)
+    alphas = [alpha]
+    for _ in range(levels):
+        alphas.append(cv2.pyrDown(alphas[-1]))
+
+    blended = None
+    for base_band, patch_band, band_alpha in reversed(
+        list(zip(base_bands, patch_bands, alphas))
+    ):
+        band = (
+            band_alpha[..., None] * patch_band + (1 - band_alpha[..., None]) * base_band
+        )
+        if blended is not None:
+            size = (band.shape[1], band.shape[0])
+            band += cv2.pyrUp(blended, dstsize=size)
+        blended = band
+    return numpy.clip(blended + 0.5, 0, 255).astype(numpy.uint8)
+
+
+def paste(base, patch, base_distance, patch_distance):
+    """takes each pixel from whichever image it is further inside"""
+    return numpy.where((patch_distance > base_distance)[..., None], patch, base)
+
+
+BLENDERS = {None: paste, "feather": feather, "multiband": multiband}
+
+
+def _direction(base_mask, patch_mask):
+    """(x, y) from the centre of the overlap to the centre of the patch"""
+    overlap = cv2.moments((base_mask & patch_mask).astype(numpy.uint8), True)
+    whole = cv2.moments(patch_mask.astype(numpy.uint8), True)
+    return (
+        whole["m10"] / whole["m00"] - overlap["m10"] / overlap["m00"],
+        whole["m01"] / whole["m00"] - overlap["m01"] / overlap["m00"],
+    )
+
+
+def blend_patch(
+    base,
+    patch,
+    mask,
+    blend: str = None,
+    base_mask=None,
+    seam: str = None,
+    seam_scale: float = 0.25,
+):
+    """
+    blends the warped patch into base, the canvas region under it, wherever both
+    are covered and returns the patch to write with mask. the patch is modified.
+    base_mask marks what is covered in base, non-black pixels if not given. seam
+    is one of seams.SEAMS, the images are then joined along a seam found at
+    seam_scale rather than half way across their overlap
+    """
+    assert blend in BLENDS, f"blend must be one of {BLENDS}"
+    assert seam in SEAMS, f"seam must be one of {SEAMS}"
+    if blend is None and seam is None:
+        return patch
+
+    base_mask = coverage(base) if base_mask is None else base_mask
+    patch_mask = mask > 0
+    roi = overlap_roi(base_mask, patch_mask)
+    if roi is None:
+        return patch
+
+    rows, cols = roi
+    logging.debug(
+        f"{blend} blending a {rows.stop - rows.start}x{cols.stop - cols.start} roi"
+    )
+    direction = _direction(base_mask, patch_mask) if seam is not None else None
+    base_roi, patch_roi = base[roi], patch[roi]
+    base_mask, patch_mask = base_mask[roi], patch_mask[roi]
+
+    # the patch's bounding box ends at the frame, the canvas carries on past it
+    clipped = (
+        int(rows.start == 0),
+        int(rows.stop == patch.shape[0]),
+        int(cols.start == 0),
+        int(cols.stop == patch.shape[1]),
+    )
+
+    # fill each image's holes with the other so neither band bleeds black
+    base_filled = numpy.where(base_mask[..., None], base_roi, patch_roi)
+    patch_filled = numpy.where(patch_mask[..., None], patch_roi, base_roi)
+
+    if seam is None:
+        base_distance, patch_distance = _distances(base_mask, patch_mask, clipped)
+    else:
+        side = SEAM_FINDERS[seam](
+            base_filled, patch_filled, base_mask, patch_mask, direction, seam_scale
+        )
+        base_distance, patch_distance = seam_distances(side)
+    blended = BLENDERS[blend](base_filled, patch_filled, base_distance, patch_distance)
+
+    overlap = base_mask & patch_mask
+    patch_roi[overlap] = blended[overlap]
+    return patch
+
+
+def write_blended(
+    canvas,
+    x_min: int,
+    y_min: int,
+    patch,
+    mask,
+    blend: str = None,
+    footprints=(),
+    seam: str = None,
+    seam_scale: float = 0.25,
+    compensator=None,
+):
+    """
+    writes the warped patch to the canvas, blended with what is already there,
+    footprints are the warped corners of every frame written before it. the
+    compensator, an exposure.GainCompensator, matches its exposure to the canvas
+    """
+    if blend is not None or seam is not None or compensator is not None:
+        height, width = patch.shape[:2]
+        base = canvas.read(x_min, y_min, x_min + width, y_min + height)
+        base_mask = footprint_mask(footprints, x_min, y_min, patch.shape)
+        if compensator is not None:
+            patch = compensator.compensate(base, patch, base_mask, mask)
+        patch = blend_patch(base, patch, mask, blend, base_mask, seam, seam_scale)
+    canvas.write(x_min, y_min, patch, mask)
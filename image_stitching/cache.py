@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import os
+import pathlib
+import threading
+
+import cv2
+import numpy
+
+DOC = """
+    on-disk cache of detected features keyed by a hash of the image and the detector
+    configuration, so re-running on the same images only loads them back
+"""
+
+# default size the cache is trimmed back to, least recently used entries go first
+MAX_BYTES = 1 << 30
+
+
+def detector_config(detector) -> str:
+    """
+    the detector's class and the values of its parameter getters, such as
+    getNFeatures, so detectors built with different parameters get different keys
+    """
+    values = []
+    for name in sorted(dir(detector)):
+        if not name.startswith("get") or name == "getDefaultName":
+            continue
+        try:
+            value = getattr(detector, name)()
+        except (cv2.error, TypeError):
+            continue
+        if isinstance(value, (bool, int, float, str)):
+            values.append(f"{name[3:]}={value}")
+    name = getattr(detector, "getDefaultName", type(detector).__name__)
+    name = name() if callable(name) else name
+    return " ".join([name, *values])
+
+
+def keypoint_arrays(keypoints, descriptors):
+    """
+    converts a list of cv2.KeyPoint and their descriptors into compact arrays,
+    float descriptors holding whole numbers 0-255, as SIFT's do, are kept as uint8
+    """
+    arrays = {
+        "points": numpy.array([kp.pt for kp in keypoints], dtype=numpy.float32),
+        "sizes": numpy.array([kp.size for kp in keypoints], dtype=numpy.float32),
+        "angles": numpy.array([kp.angle for kp in keypoints], dtype=numpy.float32),
+        "responses": numpy.array(
+            [kp.response for kp in keypoints], dtype=numpy.float32
+        ),
+        "octaves": numpy.array([kp.octave for kp in keypoints], dtype=numpy.int32),
+    }
+    arrays["points"] = arrays["points"].reshape(-1, 2)
+
+    if descriptors is None:
+        descriptors = numpy.empty((0, 0), dtype=numpy.uint8)
+    arrays["descriptor_dtype"] = numpy.array(descriptors.dtype.str)
+    if descriptors.dtype == numpy.float32 and descriptors.size:
+        whole = numpy.array_equal(descriptors, numpy.round(descriptors))
+        if whole and descriptors.min() >= 0 and descriptors.max() <= 255:
+            descriptors = descriptors.astype(numpy.uint8)
+    arrays["descriptors"] = descriptors
+    return arrays
+
+
+def arrays_keypoints(arrays):
+    """converts the arrays of keypoint_arrays back into a list of cv2.KeyPoint"""
+    fields = zip(
+        arrays["points"].tolist(),
+        arrays["sizes"].tolist(),
+        arrays["angles"].tolist(),
+        arrays["responses"].tolist(),
+        arrays["octaves"].tolist(),
+    )
+    return [
+        cv2.KeyPoint(x, y, size, angle, response, octave)
+        for (x, y), size, angle, response, octave in fields
+    ]
+
+
+def descriptors(arrays):
+    """the descriptors of keypoint_arrays in their original type, None if empty"""
+    stored = arrays["descriptors"]
+    if stored.size == 0:
+        return None
+    return stored.astype(numpy.dtype(str(arrays["descriptor_dtype"])), copy=False)
+
+
+class FeatureCache:
+    DOC = """size bounded directory of feature arrays, one .npz file per entry"""
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES):
+        """
+        constructor for a cache in directory, created if missing. once the entries
+        take more than max_bytes the least recently used are deleted
+        """
+        assert max_bytes > 0, "max_bytes must be positive"
+
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.n_bytes = sum(path.stat().st_size for path in self._entries())
+        self.hits = 0
+        self.misses = 0
+        # detector_config per detector by id, the detector is kept so ids stay unique
+        self.detector_configs = {}
+
+    def __getstate__(self):
+        """
+        the lock and the detectors cannot be pickled, worker processes get their own
+        """
+        state = self.__dict__.copy()
+        del state["lock"]
+        del state["detector_configs"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.detector_configs = {}
+
+    def _entries(self):
+        return self.directory.glob("*.npz")
+
+    def _path(self, key: str):
+        return self.directory / f"{key}.npz"
+
+    @staticmethod
+    def key(image: numpy.ndarray, config: str) -> str:
+        """hash of the image's pixels, shape and type and the detector config"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.shape} {image.dtype} {config}".encode())
+        digest.update(numpy.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def load(self, key: str):
+        """returns the arrays stored under key or None, marking them recently used"""
+        path = self._path(key)
+        try:
+            with numpy.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except (OSError, ValueError, KeyError) as error:
+            if path.exists():
+                logging.warning(f"discarding unreadable cache entry {path}: {error}")
+                path.unlink(missing_ok=True)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return arrays
+
+    def store(self, key: str, arrays: dict):
+        """
+        writes the arrays under key, to a temporary file first so readers in other
+        threads or processes never see half an entry, then evicts if over budget
+        """
+        path = self._path(key)
+        temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary, "wb") as file:
+            numpy.savez(file, **arrays)
+        size = temporary.stat().st_size
+        try:
+            # an entry overwritten in place only changes the size by the difference
+            size -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(temporary, path)
+
+        with self.lock:
+            self.n_bytes += size
+            if self.n_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """deletes the least recently used entries until the cache is within budget"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self.n_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.n_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.n_bytes -= size
+            logging.debug(f"evicted {path.name} from the feature cache")
+
+    def _detector_config(self, detector) -> str:
+        """
+        detector_config read once per detector, so parameters set after its first
+        detection are not seen
+        """
+        with self.lock:
+            entry = self.detector_configs.get(id(detector))
+        if entry is None:
+            entry = detector, detector_config(detector)
+            with self.lock:
+                self.detector_configs[id(detector)] = entry
+        return entry[1]
+
+    def detect(self, detector, image: numpy.ndarray, config: str):
+        """
+        returns the arrays of detector.detectAndCompute on the image, config names
+        anything changing its output beyond the detector's own parameters, which are
+        read from it
+        """
+        key = self.key(image, f"{config} {self._detector_config(detector)}")
+        arrays = self.load(key)
+        if arrays is None:
+            keypoints, image_descriptors = detector.detectAndCompute(image, None)
+            arrays = keypoint_arrays(keypoints, image_descriptors)
+            self.store(key, arrays)
+        return arrays
+
+    def detect_and_compute(self, detector, image: numpy.ndarray, config: str):
+        """drop in for detector.detectAndCompute(image, None) through the cache"""
+        arrays = self.detect(detector, image, config)
+        return arrays_keypoints(arrays), descriptors(arrays)
+
+    def summary(self):
+        """describes the hit rate and size of the cache"""
+        return (
+            f"feature cache {self.hits} hits {self.misses} misses,"
+            f" {self.n_bytes / 2**20:.1f} of {self.max_bytes / 2**20:.0f} MiB"
+        )
@@ -0,0 +1,347 @@
+import collections
+import logging
+import pathlib
+import shutil
+import tempfile
+import weakref
+
+import numpy
+
+DOC = """panorama canvases that grow in any direction without moving existing pixels"""
+
+# formats DiskCanvas.export streams tiles into
+EXPORT_SUFFIXES = (".ppm", ".npy")
+
+
+class DenseCanvas:
+    DOC = """
+        panorama stored as a single array with an origin offset, the array is
+        over-allocated when it grows so most frames are written in place
+    """
+
+    def __init__(self, channels: int = 3, growth: float = 0.5):
+        """constructor that creates an empty canvas, growth is the spare fraction"""
+        assert growth >= 0, "growth must not be negative"
+        self.channels = channels
+        self.growth = growth
+        self.pixels = numpy.zeros((0, 0, channels), dtype=numpy.uint8)
+        self.offset = (0, 0)
+        self.extent = None
+
+    @property
+    def origin(self):
+        """offset of the panorama origin within the rendered image"""
+        if self.extent is None:
+            return 0, 0
+        return -self.extent[0], -self.extent[1]
+
+    @property
+    def nbytes(self):
+        """bytes committed to the backing array"""
+        return self.pixels.nbytes
+
+    def bounds(self):
+        """returns (x_min, y_min, x_max, y_max) of everything written so far"""
+        return self.extent
+
+    def reserve(self, x_min: int, y_min: int, x_max: int, y_max: int):
+        """reallocates the backing array if the region does not fit inside it"""
+        x_off, y_off = self.offset
+        height, width = self.pixels.shape[:2]
+        if (
+            x_min >= x_off
+            and y_min >= y_off
+            and x_max <= x_off + width
+            and y_max <= y_off + height
+        ):
+            return
+
+        pad_x = int(self.growth * max(width, x_max - x_min))
+        pad_y = int(self.growth * max(height, y_max - y_min))
+        new_x0 = x_min - pad_x if x_min < x_off else x_off
+        new_y0 = y_min - pad_y if y_min < y_off else y_off
+        new_x1 = x_max + pad_x if x_max > x_off + width else x_off + width
+        new_y1 = y_max + pad_y if y_max > y_off + height else y_off + height
+        if width == 0:
+            new_x0, new_y0, new_x1, new_y1 = x_min, y_min, x_max, y_max
+
+        logging.debug("growing dense canvas to %dx%d", new_x1 - new_x0, new_y1 - new_y0)
+        pixels = numpy.zeros(
+            (new_y1 - new_y0, new_x1 - new_x0, self.channels), dtype=numpy.uint8
+        )
+        pixels[
+            y_off - new_y0 : y_off - new_y0 + height,
+            x_off - new_x0 : x_off - new_x0 + width,
+        ] = self.pixels
+        self.pixels = pixels
+        self.offset = (new_x0, new_y0)
+
+    def write(self, x_min: int, y_min: int, patch: numpy.ndarray, mask=None):
+        """
+        copies the patch with its top left corner at (x_min, y_min), only the pixels
+        where mask is non-zero are written
+        """
+        x_max, y_max = x_min + patch.shape[1], y_min + patch.shape[0]
+        self.reserve(x_min, y_min, x_max, y_max)
+
+        x_off, y_off = self.offset
+        region = self.pixels[
+            y_min - y_off : y_max - y_off, x_min - x_off : x_max - x_off
+        ]
+        if mask is None:
+            region[...] = patch
+        else:
+            numpy.copyto(region, patch, where=mask[..., None] > 0)
+
+        self.extent = _union(self.extent, (x_min, y_min, x_max, y_max))
+
+    def read(self, x_min: int, y_min: int, x_max: int, y_max: int):
+        """returns a copy of the region, uncovered pixels are black"""
+        shape = (y_max - y_min, x_max - x_min, self.channels)
+        region = numpy.zeros(shape, dtype=numpy.uint8)
+
+        x_off, y_off = self.offset
+        height, width = self.pixels.shape[:2]
+        x0, y0 = max(x_min, x_off), max(y_min, y_off)
+        x1, y1 = min(x_max, x_off + width), min(y_max, y_off + height)
+        if x0 < x1 and y0 < y1:
+            region[y0 - y_min : y1 - y_min, x0 - x_min : x1 - x_min] = self.pixels[
+                y0 - y_off : y1 - y_off, x0 - x_off : x1 - x_off
+            ]
+        return region
+
+    def render(self):
+        """returns the written part of the panorama"""
+        if self.extent is None:
+            return None
+        return self.read(*self.extent)
+
+
+class TiledCanvas:
+    DOC = """
+        panorama stored as fixed size tiles keyed by their position in panorama
+        coordinates, tiles are only allocated once a frame covers them
+    """
+
+    def __init__(self, tile_size: int = 512, channels: int = 3):
+        """constructor that creates an empty canvas, tiles are created lazily"""
+        assert tile_size > 0, "tile_size must be positive"
+        self.tile_size = tile_size
+        self.channels = channels
+        self.tiles = {}
+        self.extent = None
+
+    @property
+    def origin(self):
+        """offset of the panorama origin within the rendered image"""
+        if self.extent is None:
+            return 0, 0
+        return -self.extent[0], -self.extent[1]
+
+    @property
+    def nbytes(self):
+        """bytes committed to tiles"""
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def bounds(self):
+        """returns (x_min, y_min, x_max, y_max) of everything written so far"""
+        return self.extent
+
+    def reserve(self, x_min: int, y_min: int, x_max: int, y_max: int):
+        """nothing to do, tiles are only allocated once they are written to"""
+
+    def _tile_range(self, x_min, y_min, x_max, y_max):
+        """yields (row, col) of every tile touching the region"""
+        size = self.tile_size
+        for row in range(y_min // size, (y_max - 1) // size + 1):
+            for col in range(x_min // size, (x_max - 1) // size + 1):
+                yield row, col
+
+    def _get(self, row, col):
+        """returns the tile or None if nothing was written to it"""
+        return self.tiles.get((row, col))
+
+    def _tile(self, row, col):
+        """returns the tile for writing, creating it if needed"""
+        if (row, col) not in self.tiles:
+            shape = (self.tile_size, self.tile_size, self.channels)
+            self.tiles[(row, col)] = numpy.zeros(shape, dtype=numpy.uint8)
+        return self.tiles[(row, col)]
+
+    def _overlap(self, row, col, x_min, y_min, x_max, y_max):
+        """slices into the tile and into the region for their intersection"""
+        size = self.tile_size
+        x0, y0 = max(x_min, col * size), max(y_min, row * size)
+        x1, y1 = min(x_max, (col + 1) * size), min(y_max, (row + 1) * size)
+        tile_idx = numpy.s_[
+            y0 - row * size : y1 - row * size, x0 - col * size : x1 - col * size
+        ]
+        region_idx = numpy.s_[y0 - y_min : y1 - y_min, x0 - x_min : x1 - x_min]
+        return tile_idx, region_idx
+
+    def write(self, x_min: int, y_min: int, patch: numpy.ndarray, mask=None):
+        """
+        copies the patch with its top left corner at (x_min, y_min), only the pixels
+        where mask is non-zero are written and only the tiles they touch are created
+        """
+        x_max, y_max = x_min + patch.shape[1], y_min + patch.shape[0]
+
+        for row, col in self._tile_range(x_min, y_min, x_max, y_max):
+            tile_idx, region_idx = self._overlap(row, col, x_min, y_min, x_max, y_max)
+            if mask is None:
+                self._tile(row, col)[tile_idx] = patch[region_idx]
+                continue
+
+            region_mask = mask[region_idx] > 0
+            if not region_mask.any():
+                continue
+            tile = self._tile(row, col)
+            numpy.copyto(
+                tile[tile_idx], patch[region_idx], where=region_mask[..., None]
+            )
+
+        self.extent = _union(self.extent, (x_min, y_min, x_max, y_max))
+
+    def read(self, x_min: int, y_min: int, x_max: int, y_max: int):
+        """returns a copy of the region, uncovered pixels are black"""
+        shape = (y_max - y_min, x_max - x_min, self.channels)
+        region = numpy.zeros(shape, dtype=numpy.uint8)
+
+        for row, col in self._tile_range(x_min, y_min, x_max, y_max):
+            tile = self._get(row, col)
+            if tile is not None:
+                tile_idx, region_idx = self._overlap(
+                    row, col, x_min, y_min, x_max, y_max
+                )
+                region[region_idx] = tile[tile_idx]
+
+        return region
+
+    def render(self):
+        """assembles the whole panorama into a single image"""
+        if self.extent is None:
+            return None
+        return self.read(*self.extent)
+
+
+class DiskCanvas(TiledCanvas):
+    DOC = """
+        tiled panorama kept on disk with only the most recently used tiles resident,
+        so memory stays bounded however large the panorama grows
+    """
+
+    def __init__(
+        self,
+        tile_size: int = 512,
+        channels: int = 3,
+        directory: pathlib.Path = None,
+        max_resident: int = 64,
+    ):
+        """
+        constructor that creates an empty canvas in a new scratch directory inside
+        directory, the system's temporary directory by default. at most max_resident
+        tiles are held in memory, the rest are written back to the scratch directory
+        which is removed with the canvas
+        """
+        assert max_resident > 0, "max_resident must be positive"
+        super().__init__(tile_size, channels)
+        self.max_resident = max_resident
+        self.tiles = collections.OrderedDict()
+        self.dirty = set()
+        self.stored = set()
+        self.directory = pathlib.Path(tempfile.mkdtemp(prefix="canvas-", dir=directory))
+        self._cleanup = weakref.finalize(
+            self, shutil.rmtree, str(self.directory), ignore_errors=True
+        )
+
+    @property
+    def disk_bytes(self):
+        """bytes of tiles written back to disk"""
+        return len(self.stored) * self.tile_size**2 * self.channels
+
+    def close(self):
+        """removes the scratch directory, the canvas can not be used afterwards"""
+        self._cleanup()
+
+    def _path(self, row, col):
+        return self.directory / f"tile_{row}_{col}.npy"
+
+    def _evict(self):
+        """writes the least recently used tiles back to disk until few enough remain"""
+        while len(self.tiles) > self.max_resident:
+            (row, col), tile = self.tiles.popitem(last=False)
+            if (row, col) in self.dirty:
+                numpy.save(self._path(row, col), tile)
+                self.dirty.discard((row, col))
+                self.stored.add((row, col))
+
+    def _get(self, row, col):
+        """returns the tile, loading it from disk if needed, or None if never written"""
+        if (row, col) in self.tiles:
+            self.tiles.move_to_end((row, col))
+            return self.tiles[(row, col)]
+        if (row, col) not in self.stored:
+            return None
+
+        self.tiles[(row, col)] = numpy.load(self._path(row, col))
+        self._evict()
+        return self.tiles[(row, col)]
+
+    def _tile(self, row, col):
+        """returns the tile for writing, creating or loading it if needed"""
+        tile = self._get(row, col)
+        if tile is None:
+            shape = (self.tile_size, self.tile_size, self.channels)
+            tile = self.tiles[(row, col)] = numpy.zeros(shape, dtype=numpy.uint8)
+            self._evict()
+        self.dirty.add((row, col))
+        return tile
+
+    def export(self, path: pathlib.Path):
+        """
+        writes the panorama tile by tile without assembling it in memory, as a .npy
+        array or a binary .ppm most tools can convert
+        """
+        assert self.extent is not None, "nothing has been written to the canvas"
+        path = pathlib.Path(path)
+        assert (
+            path.suffix.lower() in EXPORT_SUFFIXES
+        ), f"can only export to {EXPORT_SUFFIXES}, not {path.suffix}"
+        x_min, y_min, x_max, y_max = self.extent
+        shape = (y_max - y_min, x_max - x_min, self.channels)
+        ppm = path.suffix.lower() == ".ppm"
+        assert not ppm or self.channels == 3, "ppm export needs a bgr canvas"
+
+        with open(path, "wb") as stream:
+            if ppm:
+                stream.write(f"P6\n{shape[1]} {shape[0]}\n255\n".encode())
+            else:
+                header = {"descr": "|u1", "fortran_order": False, "shape": shape}
+                numpy.lib.format.write_array_header_1_0(stream, header)
+            start = stream.tell()
+            row_bytes = shape[1] * self.channels
+            # uncovered pixels are left as the zeros the file is extended with
+            stream.truncate(start + shape[0] * row_bytes)
+
+            for row, col in sorted(self._tile_range(*self.extent)):
+                tile = self._get(row, col)
+                if tile is None:
+                    continue
+                tile_idx, region_idx = self._overlap(row, col, *self.extent)
+                patch = tile[tile_idx][..., ::-1] if ppm else tile[tile_idx]
+                y0, x0 = region_idx[0].start, region_idx[1].start
+                for y, line in enumerate(patch, y0):
+                    stream.seek(start + y * row_bytes + x0 * self.channels)
+                    stream.write(numpy.ascontiguousarray(line).tobytes())
+
+
+def _union(extent, region):
+    """bounding box of two (x_min, y_min, x_max, y_max) boxes, extent may be None"""
+    if extent is None:
+        return region
+    return (
+        min(extent[0], region[0]),
+        min(extent[1], region[1]),
+        max(extent[2], region[2]),
+        max(extent[3], region[3]),
+    )
@@ -3,12 +3,49 @@ import logging
 import cv2
 import numpy
 
+from .blending import blend_patch, coverage
+from .features import image_corners, keypoint_coords
+from .tracing import stage
+
 DOC = """helper functions for combining images, only to be used in the stitcher class"""
 
 
-def compute_matches(features0, features1, matcher, knn=5, lowe=0.7):
+def knn_search(matcher, descriptors0, descriptors1, knn):
+    """
+    returns (distances, indices) arrays of the knn nearest descriptors1 rows for every
+    descriptors0 row, plain cv2 matchers are supported by unpacking their DMatch lists
+    """
+    if hasattr(matcher, "knn_search"):
+        return matcher.knn_search(descriptors0, descriptors1, knn)
+
+    distances = numpy.full((len(descriptors0), knn), numpy.inf, dtype=numpy.float32)
+    indices = numpy.zeros((len(descriptors0), knn), dtype=numpy.int64)
+    for row, pair in enumerate(matcher.knnMatch(descriptors0, descriptors1, k=knn)):
+        for col, match in enumerate(pair):
+            distances[row, col] = match.distance
+            indices[row, col] = match.trainIdx
+    return distances, indices
+
+
+def ratio_filter(distances, indices, lowe=0.7):
     """
-    this applies lowe-ratio feature matching between feature0 and feature 1 using flann
+    applies the lowe ratio test to k-nearest neighbour arrays,
+    returns the (query, train) indices of the matches that pass. a query
+    without a finite second distance has nothing to be compared against
+    and never passes
+    """
+    positive = distances[:, 0] < lowe * distances[:, 1]
+    positive &= numpy.isfinite(distances[:, 1])
+    return numpy.flatnonzero(positive), indices[positive, 0]
+
+
+def compute_matches(
+    features0, features1, matcher, knn=5, lowe=0.7, mutual=False, trace=None
+):
+    """
+    this applies lowe-ratio feature matching between feature0 and feature 1 using flann,
+    mutual also drops matches whose feature1 does not have feature0 as its nearest match
+    and trace is the tracing.FrameTrace the search and filtering are timed in
     """
     if features0 is None or features1 is None:
         logging.warning("Either features0 or features1 is None.")
@@ -17,66 +54,131 @@ def compute_matches(features0, features1, matcher, knn=5, lowe=0.7):
     keypoints0, descriptors0 = features0
     keypoints1, descriptors1 = features1
 
+    if descriptors0 is None or descriptors1 is None or len(descriptors1) < knn:
+        logging.warning("too few descriptors to match.")
+        return None, None, 0
+
     logging.debug("finding correspondence")
 
-    matches = matcher.knnMatch(descriptors0, descriptors1, k=knn)
+    with stage(trace, "knn"):
+        distances, indices = knn_search(matcher, descriptors0, descriptors1, knn)
 
     logging.debug("filtering matches with lowe test")
 
-    positive = [
-        match0 for match0, match1 in matches if match0.distance < lowe * match1.distance
-    ]
-    src_pts = numpy.array(
-        [keypoints0[good_match.queryIdx].pt for good_match in positive],
-        dtype=numpy.float32,
-    )
-    src_pts = src_pts.reshape((-1, 1, 2))
-    dst_pts = numpy.array(
-        [keypoints1[good_match.trainIdx].pt for good_match in positive],
-        dtype=numpy.float32,
-    )
-    dst_pts = dst_pts.reshape((-1, 1, 2))
+    with stage(trace, "ratio"):
+        src_idx, dst_idx = ratio_filter(distances, indices, lowe)
+
+    if mutual and len(src_idx):
+        logging.debug("filtering matches with cross check")
+        _, reverse = knn_search(matcher, descriptors1, descriptors0, 1)
+        consistent = reverse[dst_idx, 0] == src_idx
+        src_idx, dst_idx = src_idx[consistent], dst_idx[consistent]
 
-    return src_pts, dst_pts, len(positive)
+    src_pts = keypoint_coords(keypoints0)[src_idx].reshape((-1, 1, 2))
+    dst_pts = keypoint_coords(keypoints1)[dst_idx].reshape((-1, 1, 2))
 
+    return src_pts, dst_pts, len(src_idx)
 
-def combine_images(img0, img1, h_matrix):
+
+def compute_index_matches(store, index, features, knn=2, lowe=0.7, trace=None):
     """
-    this takes two images and the homography matrix from 0 to 1 and combines the images together!
-    the logic is convoluted here and needs to be simplified!
+    lowe-ratio matching of a frame's features against a persistent FeatureIndex over
+    the store, returns the same (src, dst, n) as compute_matches with src in the store
     """
-    logging.debug("combining images... ")
+    points, descriptors = features
+    if descriptors is None or len(index) < 1:
+        logging.warning("too few descriptors to match.")
+        return None, None, 0
 
-    points0 = numpy.array(
-        [
-            [[0, 0]],
-            [[0, img0.shape[0]]],
-            [[img0.shape[1], img0.shape[0]]],
-            [[img0.shape[1], 0]],
-        ],
-        dtype=numpy.float32,
-    )
-    points1 = numpy.array(
-        [
-            [[0, 0]],
-            [[0, img1.shape[0]]],
-            [[img1.shape[1], img1.shape[0]]],
-            [[img1.shape[1], 0]],
-        ],
-        dtype=numpy.float32,
-    )
+    logging.debug("finding correspondence in the panorama index")
+    with stage(trace, "knn"):
+        distances, rows = index.knn_search(store, descriptors, knn)
+
+    logging.debug("filtering matches with lowe test")
+    with stage(trace, "ratio"):
+        dst_idx, src_rows = ratio_filter(distances, rows, lowe)
 
-    points2 = cv2.perspectiveTransform(points1, h_matrix)
+    src_pts = store.points[src_rows].reshape((-1, 1, 2))
+    dst_pts = keypoint_coords(points)[dst_idx].reshape((-1, 1, 2))
+
+    return src_pts, dst_pts, len(dst_idx)
+
+
+def canvas_translation(img0, img1, h_matrix):
+    """
+    returns the translation that moves the union of img0 and the warped img1
+    onto positive coordinates, along with the (width, height) of that union
+    """
+    points0 = image_corners(img0.shape)
+    points2 = cv2.perspectiveTransform(image_corners(img1.shape), h_matrix)
     points = numpy.concatenate((points0, points2), axis=0)
 
     [x_min, y_min] = (points.min(axis=0).ravel() - 0.5).astype(numpy.int32)
     [x_max, y_max] = (points.max(axis=0).ravel() + 0.5).astype(numpy.int32)
 
-    h_translation = numpy.array([[1, 0, -x_min], [0, 1, -y_min], [0, 0, 1]])
+    h_translation = numpy.array(
+        [[1, 0, -x_min], [0, 1, -y_min], [0, 0, 1]], dtype=numpy.float64
+    )
+    return h_translation, (x_max - x_min, y_max - y_min)
+
+
+def combine_images(
+    img0, img1, h_matrix, blend=None, seam=None, seam_scale=0.25, compensator=None
+):
+    """
+    this takes two images and the homography matrix from 0 to 1 and combines the images together!
+    the logic is convoluted here and needs to be simplified!
+    blend is one of blending.BLENDS, by default img0 is pasted over the warped img1,
+    seam is one of seams.SEAMS to join them along a seam found at seam_scale and
+    compensator an exposure.GainCompensator matching img0's exposure to img1
+    """
+    logging.debug("combining images... ")
+
+    h_translation, size = canvas_translation(img0, img1, h_matrix)
+    x_off, y_off = int(h_translation[0, 2]), int(h_translation[1, 2])
 
     logging.debug("warping previous image...")
-    output_img = cv2.warpPerspective(
-        img1, h_translation.dot(h_matrix), (x_max - x_min, y_max - y_min)
-    )
-    output_img[-y_min : img0.shape[0] - y_min, -x_min : img0.shape[1] - x_min] = img0
+    output_img = cv2.warpPerspective(img1, h_translation.dot(h_matrix), size)
+    region = output_img[y_off : img0.shape[0] + y_off, x_off : img0.shape[1] + x_off]
+    mask = numpy.full(img0.shape[:2], 255, dtype=numpy.uint8)
+    if compensator is not None:
+        img0 = compensator.compensate(region, img0, coverage(region), mask)
+    if blend is not None or seam is not None:
+        img0 = blend_patch(
+            region, img0.copy(), mask, blend, seam=seam, seam_scale=seam_scale
+        )
+    region[...] = img0
     return output_img
+
+
+def warp_image(img, h_matrix):
+    """
+    warps img by the homography into its own bounding box, only the pixels the
+    frame lands on are computed. returns the warped patch, its mask and the
+    (x, y) position of the patch's top left corner
+    """
+    corners = cv2.perspectiveTransform(image_corners(img.shape), h_matrix)
+    [x_min, y_min] = numpy.floor(corners.min(axis=0).ravel()).astype(numpy.int32)
+    [x_max, y_max] = numpy.ceil(corners.max(axis=0).ravel()).astype(numpy.int32)
+    size = (int(x_max - x_min), int(y_max - y_min))
+
+    h_translation = numpy.array(
+        [[1, 0, -x_min], [0, 1, -y_min], [0, 0, 1]], dtype=numpy.float64
+    )
+    h_inverse = numpy.linalg.inv(h_translation.dot(h_matrix))
+
+    logging.debug("warping new image...")
+    warped = cv2.warpPerspective(
+        img,
+        h_inverse,
+        size,
+        flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+    mask = cv2.warpPerspective(
+        numpy.full(img.shape[:2], 255, dtype=numpy.uint8),
+        h_inverse,
+        size,
+        flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+    )
+    return warped, mask, (int(x_min), int(y_min))
@@ -0,0 +1,144 @@
+import logging
+
+import cv2
+import numpy
+
+DOC = """
+    exposure compensation, each new frame gets gains that match its brightness to
+    what is already on the canvas where they overlap. gains are estimated from
+    downsampled overlaps as frames arrive and applied with a multiply, so there is
+    no pass over the whole panorama at the end
+"""
+
+EXPOSURES = (None, "gain", "blocks")
+
+# blocks along each side of a frame's bounding box in "blocks" mode
+BLOCKS = 8
+
+
+class GainCompensator:
+    DOC = """incremental gain or block gain compensation against the canvas"""
+
+    def __init__(
+        self,
+        blocks: int = 1,
+        scale: float = 0.1,
+        sigma_n: float = 10.0,
+        sigma_g: float = 0.1,
+    ):
+        """
+        constructor for the compensator, blocks is how many gains there are along
+        each side of a frame, 1 for a single gain per frame. overlaps are compared
+        at scale. sigma_n is the expected noise in intensity and sigma_g the spread
+        of gains, small overlaps are pulled towards the frame's gain, or 1 for it
+        """
+        assert blocks > 0, "blocks must be positive"
+        assert 0 < scale <= 1, "scale must be in (0, 1]"
+
+        self.blocks = blocks
+        self.scale = scale
+        self.sigma_n = sigma_n
+        self.sigma_g = sigma_g
+        self.gains = []
+
+    def _gain(self, n_pixels, patch_mean, base_mean, prior):
+        """
+        gain minimising the squared difference of the overlap means, with the noise
+        of a mean over n_pixels, against a gaussian prior around prior
+        """
+        confidence = n_pixels / self.sigma_n**2
+        weight = 1 / self.sigma_g**2
+        return (confidence * patch_mean * base_mean + weight * prior) / (
+            confidence * patch_mean**2 + weight
+        )
+
+    def estimate(self, base, patch, base_mask, patch_mask):
+        """
+        returns the (blocks, blocks) gains of the patch against base, the canvas
+        region under it, from their downsampled overlap
+        """
+        height, width = patch_mask.shape
+        size = (
+            max(self.blocks, int(round(width * self.scale))),
+            max(self.blocks, int(round(height * self.scale))),
+        )
+
+        def small(image):
+            return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+        base_gray = cv2.cvtColor(small(base), cv2.COLOR_RGB2GRAY).astype(numpy.float32)
+        patch_gray = cv2.cvtColor(small(patch), cv2.COLOR_RGB2GRAY)
+        patch_gray = patch_gray.astype(numpy.float32)
+        # only pixels entirely inside the overlap, edges average in the black
+        overlap = small((base_mask & patch_mask).astype(numpy.float32)) > 0.99
+
+        n_pixels = overlap.sum()
+        if n_pixels == 0:
+            return numpy.ones((self.blocks, self.blocks), dtype=numpy.float32)
+        gain = self._gain(
+            n_pixels, patch_gray[overlap].mean(), base_gray[overlap].mean(), 1.0
+        )
+
+        gains = numpy.full((self.blocks, self.blocks), gain, dtype=numpy.float32)
+        if self.blocks == 1:
+            return gains
+
+        rows = numpy.array_split(numpy.arange(size[1]), self.blocks)
+        cols = numpy.array_split(numpy.arange(size[0]), self.blocks)
+        for row, block_rows in enumerate(rows):
+            for col, block_cols in enumerate(cols):
+                block = (
+                    slice(block_rows[0], block_rows[-1] + 1),
+                    slice(block_cols[0], block_cols[-1] + 1),
+                )
+                block_overlap = overlap[block]
+                n_block = block_overlap.sum()
+                if n_block == 0:
+                    continue
+                gains[row, col] = self._gain(
+                    n_block,
+                    patch_gray[block][block_overlap].mean(),
+                    base_gray[block][block_overlap].mean(),
+                    gain,
+                )
+
+        # blocks are smoothed so neighbouring gains do not show as a grid
+        kernel = numpy.float32([0.25, 0.5, 0.25])
+        for _ in range(2):
+            gains = cv2.sepFilter2D(
+                gains, -1, kernel, kernel, borderType=cv2.BORDER_REFLECT
+            )
+        return gains
+
+    def compensate(self, base, patch, base_mask, mask):
+        """
+        returns the patch with its gains applied, base is the canvas region under it,
+        base_mask what is covered in base and mask what the patch covers
+        """
+        gains = self.estimate(base, patch, base_mask, mask > 0)
+        self.gains.append(float(gains.mean()))
+        logging.debug(f"exposure gains {gains.min():.3f}-{gains.max():.3f}")
+
+        if self.blocks == 1:
+            return cv2.convertScaleAbs(patch, alpha=float(gains[0, 0]))
+        height, width = patch.shape[:2]
+        gain_map = cv2.resize(gains, (width, height), interpolation=cv2.INTER_LINEAR)
+        compensated = patch * gain_map[..., None] + 0.5
+        return numpy.clip(compensated, 0, 255).astype(numpy.uint8)
+
+    def summary(self):
+        """describes the spread of the gains applied so far"""
+        if not self.gains:
+            return "no frames compensated"
+        return (
+            f"compensated {len(self.gains)} frames, mean gains"
+            f" {min(self.gains):.3f}-{max(self.gains):.3f}"
+        )
+
+
+def create_compensator(exposure: str):
+    """the compensator for one of EXPOSURES, None for no compensation"""
+    assert exposure in EXPOSURES, f"exposure must be one of {EXPOSURES}"
+    if exposure is None:
+        return None
+    return GainCompensator(blocks=BLOCKS if exposure == "blocks" else 1)
@@ -0,0 +1,257 @@
+import logging
+import time
+
+import cv2
+import numpy
+
+DOC = """accumulated keypoints and descriptors kept in panorama coordinates"""
+
+
+def keypoint_coords(keypoints):
+    """
+    converts a list of cv2.KeyPoint into an (N, 2) float32 array of coordinates,
+    arrays are passed straight through
+    """
+    if isinstance(keypoints, numpy.ndarray):
+        return keypoints.reshape(-1, 2).astype(numpy.float32, copy=False)
+    return numpy.array([kp.pt for kp in keypoints], dtype=numpy.float32).reshape(-1, 2)
+
+
+def image_corners(shape):
+    """the four corners of an image of the given shape, in the order cv2 expects"""
+    height, width = shape[:2]
+    return numpy.array(
+        [[[0, 0]], [[0, height]], [[width, height]], [[width, 0]]], dtype=numpy.float32
+    )
+
+
+def points_in_quad(points, quad):
+    """
+    returns a boolean mask of the points lying inside the convex quadrilateral,
+    this is done with edge cross products so it works for either winding
+    """
+    quad = quad.reshape(-1, 2).astype(numpy.float64)
+    edges = numpy.roll(quad, -1, axis=0) - quad
+    offsets = points[:, None, :] - quad[None, :, :]
+    cross = edges[None, :, 0] * offsets[:, :, 1] - edges[None, :, 1] * offsets[:, :, 0]
+    return numpy.all(cross >= 0, axis=1) | numpy.all(cross <= 0, axis=1)
+
+
+class FeatureStore:
+    DOC = """
+        keypoint coordinates and descriptors of the panorama, new frames are
+        appended in panorama coordinates rather than re-detecting the whole canvas
+    """
+
+    def __init__(self):
+        """constructor that creates an empty store, buffers grow on append"""
+        self.points = numpy.empty((0, 2), dtype=numpy.float32)
+        self.descriptors = None
+        self.alive = numpy.empty(0, dtype=bool)
+        self.size = 0
+        self.generation = 0
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.alive[: self.size]))
+
+    def _reserve(self, count, descriptors):
+        """grows the buffers geometrically so appends are amortised O(frame)"""
+        if self.descriptors is None:
+            self.descriptors = numpy.empty(
+                (0,) + descriptors.shape[1:], descriptors.dtype
+            )
+
+        if self.size + count <= len(self.points):
+            return
+
+        capacity = max(2 * len(self.points), self.size + count, 1024)
+        points = numpy.empty((capacity, 2), dtype=numpy.float32)
+        points[: self.size] = self.points[: self.size]
+        alive = numpy.zeros(capacity, dtype=bool)
+        alive[: self.size] = self.alive[: self.size]
+        stored = numpy.empty(
+            (capacity,) + self.descriptors.shape[1:], self.descriptors.dtype
+        )
+        stored[: self.size] = self.descriptors[: self.size]
+
+        self.points, self.alive, self.descriptors = points, alive, stored
+
+    def append(self, points, descriptors):
+        """adds the features of a frame, points must be in panorama coordinates"""
+        if descriptors is None or len(descriptors) == 0:
+            return
+
+        points = keypoint_coords(points)
+        count = len(points)
+        self._reserve(count, descriptors)
+
+        self.points[self.size : self.size + count] = points
+        self.descriptors[self.size : self.size + count] = descriptors
+        self.alive[self.size : self.size + count] = True
+        self.size += count
+
+    def transform(self, h_matrix):
+        """maps every stored point through the homography as the panorama moves"""
+        if self.size == 0:
+            return
+        points = self.points[: self.size].reshape(-1, 1, 2)
+        self.points[: self.size] = cv2.perspectiveTransform(points, h_matrix).reshape(
+            -1, 2
+        )
+
+    def prune(self, quad):
+        """drops the stored features inside the quad, it is about to be overwritten"""
+        if self.size == 0:
+            return
+        inside = points_in_quad(self.points[: self.size], quad)
+        self.alive[: self.size] &= ~inside
+
+        if self.size - len(self) > max(len(self), 1024):
+            self.compact()
+
+    def compact(self):
+        """removes pruned rows from the buffers"""
+        keep = self.alive[: self.size]
+        count = int(numpy.count_nonzero(keep))
+        self.points[:count] = self.points[: self.size][keep]
+        self.descriptors[:count] = self.descriptors[: self.size][keep]
+        self.alive[:count] = True
+        self.alive[count:] = False
+        self.size = count
+        self.generation += 1
+
+    def features(self):
+        """returns the live (points, descriptors) like detectAndCompute does"""
+        if self.descriptors is None:
+            return None
+        keep = self.alive[: self.size]
+        return self.points[: self.size][keep], self.descriptors[: self.size][keep]
+
+
+class FeatureIndex:
+    DOC = """
+        persistent nearest neighbour index over a FeatureStore's descriptors. each frame
+        is indexed as its own segment and segments are merged once the newer one has
+        grown to the size of the older one, so the panorama is not re-indexed per frame
+    """
+
+    def __init__(
+        self,
+        matcher,
+        retrain_threshold: int = None,
+        max_stale: float = 0.5,
+        max_overfetch: int = 256,
+    ):
+        """
+        constructor that keeps the matcher used to build and search each segment,
+        retrain_threshold forces a full rebuild once that many descriptors were added
+        since the last one and max_stale once that fraction of rows has been pruned.
+        a segment with more than max_overfetch pruned rows is rebuilt over its live
+        ones, searches fetch that many extra neighbours from it to skip them
+        """
+        self.matcher = matcher
+        self.retrain_threshold = retrain_threshold
+        self.max_stale = max_stale
+        self.max_overfetch = max_overfetch
+
+        self.segments = []
+        self.indexed = 0
+        self.added = 0
+        self.generation = None
+        self.build_time = 0.0
+
+    def __len__(self):
+        return sum(len(rows) for _, rows, _ in self.segments)
+
+    def _build(self, store, rows):
+        """
+        indexes the store rows as a new segment, the descriptors are kept
+        alongside since flann indices reference their data rather than copy it
+        """
+        start = time.perf_counter()
+        descriptors = store.descriptors[rows]
+        index = self.matcher.build(descriptors)
+        self.build_time += time.perf_counter() - start
+        return index, rows, descriptors
+
+    def retrain(self, store):
+        """rebuilds a single segment over the live rows, compacting the store first"""
+        logging.debug("retraining the panorama index")
+        if store.size != len(store):
+            store.compact()
+        self.segments = [self._build(store, numpy.arange(store.size))]
+        self.indexed = store.size
+        self.added = 0
+        self.generation = store.generation
+
+    def update(self, store):
+        """indexes the rows appended to the store since the last update"""
+        stale = len(self) - int(numpy.count_nonzero(store.alive[: self.indexed]))
+        if (
+            store.generation != self.generation
+            or stale > self.max_stale * max(len(self), 1)
+            or (self.retrain_threshold and self.added >= self.retrain_threshold)
+        ):
+            self.retrain(store)
+            return
+
+        self._drop_stale(store)
+        if store.size == self.indexed:
+            return
+
+        self.added += store.size - self.indexed
+        self.segments.append(self._build(store, numpy.arange(self.indexed, store.size)))
+        self.indexed = store.size
+
+        while len(self.segments) > 1 and len(self.segments[-1][1]) >= len(
+            self.segments[-2][1]
+        ):
+            (_, older, _), (_, newer, _) = self.segments[-2], self.segments[-1]
+            self.segments[-2:] = [self._build(store, numpy.concatenate((older, newer)))]
+
+    def _drop_stale(self, store):
+        """rebuilds the segments holding more than max_overfetch pruned rows"""
+        segments = []
+        for segment in self.segments:
+            rows = segment[1]
+            live = rows[store.alive[rows]]
+            if len(rows) - len(live) <= self.max_overfetch:
+                segments.append(segment)
+            elif len(live):
+                segments.append(self._build(store, live))
+        self.segments = segments
+
+    def knn_search(self, store, descriptors, knn: int):
+        """
+        returns (distances, store rows) of the knn nearest live descriptors for every
+        query descriptor, merged across the segments, missing neighbours are inf
+        """
+        all_distances = [numpy.empty((len(descriptors), 0), dtype=numpy.float32)]
+        all_rows = [numpy.empty((len(descriptors), 0), dtype=numpy.int64)]
+        for index, rows, _ in self.segments:
+            n_live = int(numpy.count_nonzero(store.alive[rows]))
+            if n_live == 0:
+                continue
+            # pruned rows are only masked out afterwards, fetching one more
+            # neighbour per pruned row keeps knn live ones among them
+            k = min(knn + len(rows) - n_live, len(rows))
+            distances, indices = self.matcher.search(index, descriptors, k)
+            all_distances.append(distances)
+            all_rows.append(rows[indices])
+
+        distances = numpy.concatenate(all_distances, axis=1)
+        rows = numpy.concatenate(all_rows, axis=1)
+        distances[~store.alive[rows]] = numpy.inf
+
+        if distances.shape[1] < knn:
+            missing = knn - distances.shape[1]
+            distances = numpy.pad(
+                distances, ((0, 0), (0, missing)), constant_values=numpy.inf
+            )
+            rows = numpy.pad(rows, ((0, 0), (0, missing)))
+
+        order = numpy.argsort(distances, axis=1)[:, :knn]
+        return (
+            numpy.take_along_axis(distances, order, axis=1),
+            numpy.take_along_axis(rows, order, axis=1),
+        )
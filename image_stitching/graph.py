@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import cv2
+import numpy
+
+from .backends import FeatureBackend
+from .cache import FeatureCache
+from .combine import compute_matches
+from .registration import FrameRegistration
+
+DOC = """
+    match graph of an unordered image set, every candidate pair is matched once in a
+    process pool and the stitch order is taken from the maximum spanning tree
+"""
+
+# per process state of the pool workers, set by their initializer
+_WORKER = {}
+
+
+class PairMatch(NamedTuple):
+    """the homography taking image j into image i, and how well they matched"""
+
+    i: int
+    j: int
+    homography: numpy.ndarray
+    n_matches: int
+    n_inliers: int
+
+
+def _init_worker(features, matcher, descriptors, cache=None):
+    """creates the worker's backend, descriptors is None for the detection pool"""
+    backend = FeatureBackend(features, matcher, cache)
+    _WORKER["backend"] = backend
+    _WORKER["descriptors"] = descriptors
+
+
+def _detect(item):
+    """returns (shape, points, descriptors) of an image array or path"""
+    image = cv2.imread(str(item)) if isinstance(item, (str, pathlib.Path)) else item
+    if image is None:
+        logging.warning(f"unreadable image {item}")
+        return (0, 0), numpy.empty((0, 2), dtype=numpy.float32), None
+    image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return (image.shape[:2], *_WORKER["backend"].detect(image_gray))
+
+
+def _match(pair, lowe, min_inliers):
+    """matches one pair of images, returns a PairMatch or None"""
+    i, j = pair
+    features = _WORKER["descriptors"]
+    matches_i, matches_j, n_matches = compute_matches(
+        features[i], features[j], _WORKER["backend"].matcher, knn=2, lowe=lowe
+    )
+    if n_matches < min_inliers:
+        return None
+
+    homography, inliers = cv2.findHomography(matches_j, matches_i, cv2.RANSAC, 5.0)
+    if homography is None or inliers.sum() < min_inliers:
+        return None
+    return PairMatch(i, j, homography, n_matches, int(inliers.sum()))
+
+
+class MatchGraph:
+    DOC = """images as nodes and matched pairs as edges weighted by their inliers"""
+
+    def __init__(self, n_images: int, shapes, names=None):
+        """constructor for a graph without edges"""
+        self.n_images = n_images
+        self.shapes = shapes
+        self.names = names if names is not None else [str(i) for i in range(n_images)]
+        self.edges = {}
+        # node -> {neighbour: (homography from the neighbour into node, inliers)}
+        self.adjacency = {}
+
+    def add(self, match: PairMatch):
+        """adds the edge between images i and j, inverting its homography once"""
+        self.edges[(match.i, match.j)] = match
+        self.adjacency.setdefault(match.i, {})[match.j] = (
+            match.homography,
+            match.n_inliers,
+        )
+        self.adjacency.setdefault(match.j, {})[match.i] = (
+            numpy.linalg.inv(match.homography),
+            match.n_inliers,
+        )
+
+    def neighbours(self, node: int):
+        """yields (neighbour, homography from the neighbour into node, inliers)"""
+        for neighbour, (homography, inliers) in self.adjacency.get(node, {}).items():
+            yield neighbour, homography, inliers
+
+    def components(self):
+        """connected components, largest first"""
+        unvisited, components = set(range(self.n_images)), []
+        while unvisited:
+            stack, component = [unvisited.pop()], []
+            while stack:
+                node = stack.pop()
+                component.append(node)
+                for neighbour, _, _ in self.neighbours(node):
+                    if neighbour in unvisited:
+                        unvisited.remove(neighbour)
+                        stack.append(neighbour)
+            components.append(sorted(component))
+        return sorted(components, key=len, reverse=True)
+
+    def root(self, component=None):
+        """the image with the most inliers to its neighbours, the panorama's centre"""
+        component = self.components()[0] if component is None else component
+        weights = {node: 0 for node in component}
+        for (i, j), match in self.edges.items():
+            if i in weights:
+                weights[i] += match.n_inliers
+                weights[j] += match.n_inliers
+        return max(component, key=lambda node: weights[node])
+
+    def spanning_tree(self, root: int = None):
+        """
+        prim's maximum spanning tree from the root over its component, returns the
+        (parent, child, homography from child to parent) edges in the order the
+        children joined the tree, so every image overlaps one stitched before it
+        """
+        root = self.root() if root is None else root
+        visited, tree, heap = {root}, [], []
+        counter = itertools.count()
+
+        def push(node):
+            for neighbour, homography, inliers in self.neighbours(node):
+                if neighbour not in visited:
+                    entry = (-inliers, next(counter), node, neighbour, homography)
+                    heapq.heappush(heap, entry)
+
+        push(root)
+        while heap:
+            _, _, parent, child, homography = heapq.heappop(heap)
+            if child in visited:
+                continue
+            visited.add(child)
+            tree.append((parent, child, homography))
+            push(child)
+        return tree
+
+    def stitch_order(self, root: int = None):
+        """image indices in the order to stitch them, the root's component only"""
+        root = self.root() if root is None else root
+        return [root] + [child for _, child, _ in self.spanning_tree(root)]
+
+    def registrations(self, root: int = None):
+        """
+        FrameRegistrations placing every connected image in the root's coordinates
+        by chaining the pairwise homographies along the spanning tree, the matches
+        and inliers are those of the tree edge to each image's parent, the root's are
+        the total over its edges
+        """
+        root = self.root() if root is None else root
+        n_inliers = sum(inliers for _, _, inliers in self.neighbours(root))
+        placed = {root: (numpy.eye(3), n_inliers, n_inliers)}
+        for parent, child, homography in self.spanning_tree(root):
+            match = self.edges.get((parent, child)) or self.edges[(child, parent)]
+            to_root = placed[parent][0].dot(homography)
+            placed[child] = (to_root, match.n_matches, match.n_inliers)
+
+        return [
+            FrameRegistration(
+                index=node,
+                shape=tuple(self.shapes[node]),
+                homography=homography,
+                n_matches=n_matches,
+                n_inliers=n_inliers,
+            )
+            for node, (homography, n_matches, n_inliers) in sorted(placed.items())
+        ]
+
+    def to_json(self, path: pathlib.Path):
+        """writes the nodes, edges and spanning tree to a json file"""
+        tree = self.spanning_tree() if self.edges else []
+        record = {
+            "nodes": [
+                {"index": i, "name": name, "shape": [int(s) for s in self.shapes[i]]}
+                for i, name in enumerate(self.names)
+            ],
+            "edges": [
+                {
+                    "i": int(match.i),
+                    "j": int(match.j),
+                    "n_matches": int(match.n_matches),
+                    "n_inliers": int(match.n_inliers),
+                    "homography": match.homography.tolist(),
+                }
+                for match in self.edges.values()
+            ],
+            "tree": [[int(parent), int(child)] for parent, child, _ in tree],
+            "order": self.stitch_order() if self.edges else [],
+        }
+        pathlib.Path(path).write_text(json.dumps(record, indent=2))
+
+    def to_dot(self, path: pathlib.Path):
+        """writes the graph for graphviz, spanning tree edges are drawn bold"""
+        tree = self.spanning_tree() if self.edges else []
+        tree = {frozenset((parent, child)) for parent, child, _ in tree}
+        lines = ["graph matches {"]
+        for i, name in enumerate(self.names):
+            lines.append(f'    {i} [label="{name}"];')
+        for (i, j), match in self.edges.items():
+            style = ", style=bold" if frozenset((i, j)) in tree else ""
+            lines.append(f'    {i} -- {j} [label="{match.n_inliers}"{style}];')
+        lines.append("}")
+        pathlib.Path(path).write_text("\n".join(lines) + "\n")
+
+
+def match_graph(
+    images,
+    features: str = "sift",
+    matcher: str = "flann",
+    workers: int = None,
+    lowe: float = 0.7,
+    min_inliers: int = 20,
+    pairs=None,
+    feature_cache: str = None,
+):
+    """
+    builds the MatchGraph of images, a list of arrays or paths. features are
+    detected once per image, or loaded from the feature_cache directory, and each
+    candidate pair, every pair unless given, is matched in a pool of worker processes
+    """
+    images = list(images)
+    workers = os.cpu_count() if workers is None else workers
+    names = [
+        pathlib.Path(item).name if isinstance(item, (str, pathlib.Path)) else str(i)
+        for i, item in enumerate(images)
+    ]
+    pairs = list(
+        itertools.combinations(range(len(images)), 2) if pairs is None else pairs
+    )
+
+    cache = FeatureCache(feature_cache) if feature_cache is not None else None
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(features, matcher, None, cache)
+    ) as pool:
+        detected = list(pool.map(_detect, images))
+    shapes = [shape for shape, _, _ in detected]
+    image_features = [(points, descriptors) for _, points, descriptors in detected]
+    logging.info(f"detected features in {len(images)} images")
+
+    graph = MatchGraph(len(images), shapes, names)
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(features, matcher, image_features)
+    ) as pool:
+        chunksize = max(1, len(pairs) // (4 * workers))
+        matches = pool.map(
+            _match,
+            pairs,
+            itertools.repeat(lowe),
+            itertools.repeat(min_inliers),
+            chunksize=chunksize,
+        )
+        for match in matches:
+            if match is not None:
+                graph.add(match)
+    logging.info(f"{len(graph.edges)} of {len(pairs)} pairs matched")
+    return graph
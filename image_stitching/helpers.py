@@ -1,5 +1,7 @@
 import logging
 import pathlib
+import queue
+import threading
 from typing import Generator, List
 
 import cv2
@@ -39,13 +41,78 @@ def save_frames_as_images(video_path: pathlib.Path, output_directory: pathlib.Pa
     cap.release()
 
 
+def frame_paths(image_directory: pathlib.Path) -> List[pathlib.Path]:
+    """Paths of the saved frames in the order they were written."""
+    return sorted(image_directory.glob("*.png"))  # Adjust the file extension as needed
+
+
 def load_frames(image_directory: pathlib.Path):
     """Load saved frames from images and yield them one by one."""
-    image_files = sorted(
-        image_directory.glob("*.png")
-    )  # Adjust the file extension as needed
-
-    for image_file in image_files:
+    for image_file in frame_paths(image_directory):
         frame = cv2.imread(str(image_file))
         if frame is not None:
             yield frame
+
+
+def stream_frames(
+    video_path: pathlib.Path, queue_size: int = 8, dump_directory: pathlib.Path = None
+) -> Generator[numpy.ndarray, None, None]:
+    """
+    Yield frames straight from the video, decoded by a background thread into a
+    queue of at most queue_size frames so memory stays bounded. dump_directory
+    additionally saves every frame as a png for debugging.
+    """
+    assert queue_size > 0, "queue_size must be positive"
+    if dump_directory is not None:
+        dump_directory = pathlib.Path(dump_directory)
+        dump_directory.mkdir(parents=True, exist_ok=True)
+
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode():
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            if not cap.isOpened():
+                raise IOError(f"could not open video {video_path}")
+            frame_count = 0
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    break
+                if dump_directory is not None:
+                    frame_filename = dump_directory / f"frame{frame_count:04d}.png"
+                    cv2.imwrite(str(frame_filename), frame)
+                frame_count += 1
+                if not put(frame):
+                    break
+            logging.debug(f"decoded {frame_count} frames from {video_path}")
+            put(finished)
+        except Exception as error:
+            put(error)
+        finally:
+            cap.release()
+
+    decoder = threading.Thread(target=decode, name="frame-decoder", daemon=True)
+    decoder.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        decoder.join()
@@ -0,0 +1,158 @@
+import logging
+import time
+
+import cv2
+import numpy
+
+from .features import image_corners
+
+DOC = """
+    keyframe selection for video, frames that mostly overlap the last keyframe add
+    nothing to the panorama so they are dropped before the stitcher sees them
+"""
+
+
+class KeyframeSelector:
+    DOC = """picks keyframes from a frame stream by their estimated overlap"""
+
+    def __init__(
+        self,
+        min_overlap: float = 0.6,
+        registration_mpx: float = 0.1,
+        lowe: float = 0.7,
+        min_matches: int = 20,
+    ):
+        """
+        constructor for the selector, consecutive keyframes overlap by at least
+        min_overlap of a frame's area where possible. overlaps are estimated from an
+        ORB homography at registration_mpx megapixels, which is far cheaper than the
+        stitcher's own registration
+        """
+        assert 0.0 < min_overlap < 1.0, "min_overlap must be between 0 and 1"
+        assert registration_mpx > 0, "mpx must be positive"
+
+        self.min_overlap = min_overlap
+        self.registration_mpx = registration_mpx
+        self.lowe = lowe
+        self.min_matches = min_matches
+
+        self.detector = cv2.ORB.create()
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+
+        self.n_frames = 0
+        self.n_keyframes = 0
+        self.elapsed = 0.0
+
+    @property
+    def dropped(self):
+        """frames seen but not yielded"""
+        return self.n_frames - self.n_keyframes
+
+    def _detect(self, image):
+        """returns (keypoints, descriptors, shape) of the downscaled gray image"""
+        image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        pixels = image_gray.shape[0] * image_gray.shape[1]
+        scale = min(1.0, float(numpy.sqrt(self.registration_mpx * 1e6 / pixels)))
+        if scale < 1.0:
+            image_gray = cv2.resize(
+                image_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        keypoints, descriptors = self.detector.detectAndCompute(image_gray, None)
+        return keypoints, descriptors, image_gray.shape
+
+    def overlap(self, keyframe, frame):
+        """
+        fraction of the keyframe covered by the frame, both as returned by _detect,
+        0 when they could not be matched
+        """
+        keypoints0, descriptors0, shape = keyframe
+        keypoints1, descriptors1, _ = frame
+        if descriptors0 is None or descriptors1 is None or len(descriptors1) < 2:
+            return 0.0
+
+        matches = self.matcher.knnMatch(descriptors1, descriptors0, k=2)
+        good = [
+            pair[0]
+            for pair in matches
+            if len(pair) == 2 and pair[0].distance < self.lowe * pair[1].distance
+        ]
+        if len(good) < self.min_matches:
+            return 0.0
+
+        src = numpy.float32([keypoints1[m.queryIdx].pt for m in good])
+        dst = numpy.float32([keypoints0[m.trainIdx].pt for m in good])
+        homography, _ = cv2.findHomography(src, dst, cv2.RANSAC, 3.0)
+        if homography is None:
+            return 0.0
+
+        keyframe_corners = image_corners(shape).reshape(-1, 2)
+        frame_corners = cv2.perspectiveTransform(image_corners(shape), homography)
+        frame_corners = frame_corners.reshape(-1, 2).astype(numpy.float32)
+        if not cv2.isContourConvex(frame_corners):
+            return 0.0
+
+        area, _ = cv2.intersectConvexConvex(keyframe_corners, frame_corners)
+        return float(area) / (shape[0] * shape[1])
+
+    def select(self, frames):
+        """
+        yields the keyframes of the frames in order. a frame is held back while it
+        still overlaps the last keyframe by min_overlap and is only yielded once the
+        next frame does not, so the panorama advances as far as possible per keyframe.
+        the first and last frames are always kept
+        """
+        keyframe, candidate = None, None
+
+        for frame in frames:
+            start = time.perf_counter()
+            self.n_frames += 1
+            features = self._detect(frame)
+
+            if keyframe is None:
+                keyframe = features
+                self.elapsed += time.perf_counter() - start
+                self.n_keyframes += 1
+                yield frame
+                continue
+
+            overlap = self.overlap(keyframe, features)
+            if overlap < self.min_overlap and candidate is not None:
+                candidate_frame, keyframe = candidate
+                candidate = None
+                self.elapsed += time.perf_counter() - start
+                self.n_keyframes += 1
+                yield candidate_frame
+                start = time.perf_counter()
+                overlap = self.overlap(keyframe, features)
+
+            logging.debug(
+                f"frame {self.n_frames - 1} overlaps keyframe by {overlap:.2f}"
+            )
+            if overlap >= self.min_overlap:
+                candidate = frame, features
+                self.elapsed += time.perf_counter() - start
+                continue
+
+            keyframe = features
+            self.elapsed += time.perf_counter() - start
+            self.n_keyframes += 1
+            yield frame
+
+        if candidate is not None:
+            self.n_keyframes += 1
+            yield candidate[0]
+
+    def summary(self, stitch_seconds: float = None):
+        """
+        describes how many frames were dropped, stitch_seconds is the total time the
+        stitcher spent including selection, from which the time saved is estimated
+        """
+        message = (
+            f"kept {self.n_keyframes} of {self.n_frames} frames, dropped {self.dropped}"
+            f" in {self.elapsed:.2f}s of keyframe selection"
+        )
+        if stitch_seconds is not None and self.n_keyframes:
+            per_frame = (stitch_seconds - self.elapsed) / self.n_keyframes
+            saved = self.dropped * per_frame - self.elapsed
+            message += f", saving about {saved:.1f}s of stitching"
+        return message
@@ -0,0 +1,86 @@
+import logging
+
+import cv2
+import numpy
+
+DOC = """
+    frame quality gating, blurry frames waste a feature detection pass and smear the
+    panorama so only the sharpest frame of every few is passed on
+"""
+
+
+def sharpness(image: numpy.ndarray, max_pixels: int = 40000) -> float:
+    """
+    variance of the laplacian of the gray image, higher is sharper. the image is
+    subsampled by striding to about max_pixels first, which keeps the fine detail
+    blur removes and costs well under a millisecond even for 4k frames
+    """
+    step = max(1, int(numpy.sqrt(image.shape[0] * image.shape[1] / max_pixels)))
+    small = numpy.ascontiguousarray(image[::step, ::step])
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(small, cv2.CV_32F).var())
+
+
+class QualityGate:
+    DOC = """passes on the sharpest frame of each window of frames"""
+
+    def __init__(self, window: int = 5, min_sharpness: float = None):
+        """
+        constructor for the gate, one frame is kept out of every window frames and
+        frames scoring below min_sharpness are never kept, even if sharpest
+        """
+        assert window > 0, "window must be positive"
+
+        self.window = window
+        self.min_sharpness = min_sharpness
+        self.scores = []
+        self.n_kept = 0
+
+    @property
+    def n_frames(self):
+        """frames scored so far"""
+        return len(self.scores)
+
+    def _best(self, candidates):
+        """returns the sharpest (index, frame, score) of the candidates or None"""
+        index, frame, score = max(candidates, key=lambda candidate: candidate[2])
+        scores = ", ".join(f"{candidate[2]:.1f}" for candidate in candidates)
+        logging.debug(
+            f"sharpness of frames {candidates[0][0]}-{candidates[-1][0]}: {scores}"
+        )
+
+        if self.min_sharpness is not None and score < self.min_sharpness:
+            logging.debug(f"dropping every frame, none reach {self.min_sharpness}")
+            return None
+        self.n_kept += 1
+        return index, frame, score
+
+    def select(self, frames):
+        """yields the sharpest frame of each window of frames in order"""
+        candidates = []
+        for frame in frames:
+            score = sharpness(frame)
+            candidates.append((self.n_frames, frame, score))
+            self.scores.append(score)
+
+            if len(candidates) == self.window:
+                best = self._best(candidates)
+                candidates = []
+                if best is not None:
+                    yield best[1]
+
+        if candidates:
+            best = self._best(candidates)
+            if best is not None:
+                yield best[1]
+
+    def summary(self):
+        """describes how many frames were kept and the spread of their scores"""
+        if not self.scores:
+            return "no frames scored"
+        low, median, high = numpy.percentile(self.scores, [5, 50, 95])
+        return (
+            f"kept {self.n_kept} of {self.n_frames} frames, sharpness 5th percentile"
+            f" {low:.1f} median {median:.1f} 95th percentile {high:.1f}"
+        )
@@ -0,0 +1,123 @@
+import json
+import logging
+import pathlib
+from typing import NamedTuple, Tuple
+
+import cv2
+import numpy
+
+from .blending import write_blended
+from .canvas import DenseCanvas
+from .combine import warp_image
+from .features import image_corners
+
+DOC = """
+    per-frame registration records and the render pass that composites them,
+    so registration and rendering can run at different times or on different machines
+"""
+
+
+class FrameRegistration(NamedTuple):
+    """where a frame sits in the panorama, and how well it was matched"""
+
+    index: int
+    shape: Tuple[int, int]
+    homography: numpy.ndarray
+    n_matches: int
+    n_inliers: int
+
+
+def save_registrations(path: pathlib.Path, registrations):
+    """writes the registrations to a json file"""
+    records = [
+        {
+            "index": int(registration.index),
+            "shape": [int(size) for size in registration.shape],
+            "homography": numpy.asarray(registration.homography).tolist(),
+            "n_matches": int(registration.n_matches),
+            "n_inliers": int(registration.n_inliers),
+        }
+        for registration in registrations
+    ]
+    pathlib.Path(path).write_text(json.dumps(records, indent=2))
+
+
+def load_registrations(path: pathlib.Path):
+    """reads registrations written by save_registrations"""
+    records = json.loads(pathlib.Path(path).read_text())
+    return [
+        FrameRegistration(
+            index=record["index"],
+            shape=tuple(record["shape"]),
+            homography=numpy.array(record["homography"], dtype=numpy.float64),
+            n_matches=record["n_matches"],
+            n_inliers=record["n_inliers"],
+        )
+        for record in sorted(records, key=lambda record: record["index"])
+    ]
+
+
+def panorama_bounds(registrations):
+    """returns (x_min, y_min, x_max, y_max) of the union of every warped frame"""
+    corners = numpy.concatenate(
+        [
+            cv2.perspectiveTransform(image_corners(reg.shape), reg.homography)
+            for reg in registrations
+        ],
+        axis=0,
+    )
+    [x_min, y_min] = numpy.floor(corners.min(axis=0).ravel()).astype(int)
+    [x_max, y_max] = numpy.ceil(corners.max(axis=0).ravel()).astype(int)
+    return int(x_min), int(y_min), int(x_max), int(y_max)
+
+
+def render_panorama(
+    frames,
+    registrations,
+    canvas=None,
+    blend=None,
+    seam=None,
+    seam_scale=0.25,
+    compensator=None,
+):
+    """
+    composites every registered frame exactly once, frames is an iterable of
+    every image passed to registration in the same order, unregistered frames
+    are skipped. the canvas is sized once from the union of the warped corners,
+    blend is one of blending.BLENDS and seam one of seams.SEAMS. compensator is a
+    fresh exposure.GainCompensator to match each frame's exposure to the canvas
+    """
+    if not registrations:
+        return None
+
+    canvas = DenseCanvas() if canvas is None else canvas
+    canvas.reserve(*panorama_bounds(registrations))
+    by_index = {registration.index: registration for registration in registrations}
+    footprints = []
+
+    for index, frame in enumerate(frames):
+        registration = by_index.get(index)
+        if registration is None:
+            continue
+
+        logging.debug(f"rendering frame {index}")
+        warped, mask, (x_min, y_min) = warp_image(frame, registration.homography)
+        write_blended(
+            canvas,
+            x_min,
+            y_min,
+            warped,
+            mask,
+            blend,
+            footprints,
+            seam,
+            seam_scale,
+            compensator,
+        )
+        footprints.append(
+            cv2.perspectiveTransform(
+                image_corners(registration.shape), registration.homography
+            )
+        )
+
+    return canvas.render()
@@ -0,0 +1,94 @@
+import logging
+
+import cv2
+import numpy
+
+DOC = """
+    seam finding between a new frame and the canvas, restricted to their overlap and
+    run at a reduced scale, so moving objects are cut around rather than ghosted
+"""
+
+SEAMS = (None, "dp")
+
+# cost of the seam leaving the overlap, where it makes no difference to the output
+OUTSIDE_COST = 1e4
+
+# half width in pixels of the ramp feathering uses across a seam
+TRANSITION = 8
+
+
+def _min_cost_path(cost):
+    """
+    dynamic programming over the rows of cost, returns for every row the column
+    of the cheapest top to bottom path moving at most one column per row
+    """
+    height, width = cost.shape
+    total = cost.copy()
+    steps = numpy.zeros((height, width), dtype=numpy.int8)
+
+    for row in range(1, height):
+        previous = total[row - 1]
+        left = numpy.concatenate(([numpy.inf], previous[:-1]))
+        right = numpy.concatenate((previous[1:], [numpy.inf]))
+        choices = numpy.stack((left, previous, right))
+        best = choices.argmin(axis=0)
+        total[row] += choices[best, numpy.arange(width)]
+        steps[row] = best - 1
+
+    path = numpy.empty(height, dtype=numpy.int64)
+    path[-1] = total[-1].argmin()
+    for row in range(height - 1, 0, -1):
+        path[row - 1] = path[row] + steps[row, path[row]]
+    return path
+
+
+def dp_seam(base, patch, base_mask, patch_mask, direction, scale: float = 0.25):
+    """
+    returns the pixels of the roi that should come from the patch, split from the
+    base by the seam through their overlap where the two images differ least.
+    direction is the (x, y) way the patch extends beyond the overlap, the seam runs
+    across it and the patch takes the side it points to. found at scale
+    """
+    height, width = base_mask.shape
+    small = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+
+    difference = cv2.absdiff(base, patch).astype(numpy.float32).sum(axis=-1)
+    difference = cv2.resize(difference, small, interpolation=cv2.INTER_AREA)
+    overlap = cv2.resize(
+        (base_mask & patch_mask).astype(numpy.uint8),
+        small,
+        interpolation=cv2.INTER_NEAREST,
+    )
+    cost = numpy.where(overlap > 0, difference, OUTSIDE_COST)
+
+    vertical = abs(direction[0]) >= abs(direction[1])
+    forward = direction[0] >= 0 if vertical else direction[1] >= 0
+    if not vertical:
+        cost = cost.T
+
+    path = _min_cost_path(cost)
+    columns = numpy.arange(cost.shape[1])[None, :]
+    right_of_seam = columns >= path[:, None]
+    seam = right_of_seam if forward else ~right_of_seam
+
+    if not vertical:
+        seam = seam.T
+    logging.debug(f"found a seam over a {small[0]}x{small[1]} overlap")
+    seam = cv2.resize(
+        seam.astype(numpy.uint8), (width, height), interpolation=cv2.INTER_NEAREST
+    )
+    return seam > 0
+
+
+def seam_distances(seam, transition: float = TRANSITION):
+    """
+    (base, patch) distances that put the blenders' boundary on the seam, feathering
+    ramps across 2 * transition pixels centred on it
+    """
+    inside = cv2.distanceTransform(seam.astype(numpy.uint8), cv2.DIST_L2, 3)
+    outside = cv2.distanceTransform((~seam).astype(numpy.uint8), cv2.DIST_L2, 3)
+    patch_distance = numpy.clip(transition + inside - outside, 0, 2 * transition)
+    return 2 * transition - patch_distance, patch_distance
+
+
+SEAM_FINDERS = {"dp": dp_seam}
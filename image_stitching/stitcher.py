@@ -1,70 +1,696 @@
+import collections
+import contextlib
 import logging
+import time
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy
 
-from .combine import combine_images, compute_matches
+from .backends import FeatureBackend
+from .blending import BLENDS, write_blended
+from .cache import FeatureCache
+from .canvas import DenseCanvas, DiskCanvas, TiledCanvas
+from .combine import (
+    canvas_translation,
+    combine_images,
+    compute_index_matches,
+    compute_matches,
+    warp_image,
+)
+from .exposure import EXPOSURES, create_compensator
+from .features import FeatureIndex, FeatureStore, image_corners
+from .registration import FrameRegistration, render_panorama
+from .seams import SEAMS
+from .tracing import stage
+from .tracking import FlowTracker
+from .validation import HomographyGuard
 
 DOC = """ImageStitcher class for combining all images together"""
 
+REGISTRATIONS = ("canvas", "frame", "flow")
+CANVASES = (None, "dense", "tiled", "disk")
+
 
 class ImageStitcher:
     DOC = """ImageStitcher class for combining all images together"""
 
-    def __init__(self, min_num: int = 10, lowe: float = 0.7, knn_clusters: int = 2):
-        """constructor that initialises the SIFT class and Flann matcher"""
+    def __init__(
+        self,
+        min_num: int = 10,
+        lowe: float = 0.7,
+        knn_clusters: int = 2,
+        registration: str = "canvas",
+        reanchor_interval: int = 10,
+        canvas: str = None,
+        tile_size: int = 512,
+        canvas_directory: str = None,
+        resident_tiles: int = 64,
+        blend: str = None,
+        seam: str = None,
+        seam_scale: float = 0.25,
+        exposure: str = None,
+        reference: numpy.ndarray = None,
+        registration_mpx: float = None,
+        features: str = "sift",
+        matcher: str = "flann",
+        feature_cache: str = None,
+        persistent_index: bool = True,
+        min_tracks: int = 100,
+        min_anchor_ratio: float = 0.3,
+        tracer=None,
+        guard: HomographyGuard = None,
+        max_canvas_bytes: int = None,
+    ):
+        """
+        constructor that initialises the feature detector and its matcher, features is
+        one of "sift", "orb", "akaze" or "brisk" and matcher is "flann" or "bf".
+        feature_cache is a directory detected features are cached in, keyed by image
+        content, so stitching the same images again skips detection.
+        persistent_index keeps a flann index over the panorama features between frames.
+        registration "canvas" matches every frame against the whole panorama whereas
+        "frame" matches against the previous frame and chains the homographies,
+        re-anchoring against the panorama every reanchor_interval frames. "flow" is
+        for video, it tracks corners from the previous frame with lucas-kanade and only
+        detects features to re-anchor, or when fewer than min_tracks tracks survive.
+        a re-anchor with fewer than min_num inliers, or under min_anchor_ratio of its
+        matches, is treated as a mismatch and the frame is placed by its tracks alone.
+        canvas None re-warps the panorama into each new frame, "dense" and "tiled"
+        keep the panorama's coordinates fixed and only warp each new frame into a
+        DenseCanvas or TiledCanvas. "disk" is a DiskCanvas in a scratch directory under
+        canvas_directory holding at most resident_tiles tiles in memory, export the
+        result with canvas.export rather than image() for panoramas larger than memory.
+        blend is None to paste each frame over the panorama, "feather" or "multiband"
+        blend it in over the bounding box of where they overlap. seam "dp" joins frames
+        along the seam through their overlap where they differ least, found at
+        seam_scale, so moving objects are not ghosted.
+        exposure "gain" scales each new frame to match the panorama's brightness where
+        they overlap and "blocks" does so over a grid of blocks, None leaves it as is.
+        reference is the homography placing the first frame in those fixed coordinates,
+        which register also uses, identity by default. add_image needs a canvas for
+        it, canvas None keeps the panorama in the newest frame's coordinates.
+        registration_mpx caps the megapixels features are detected and matched at,
+        homographies are scaled back so the full resolution frames are composited.
+        tracer is a tracing.TraceCollector given the stage timings and counts of every
+        frame, nothing is timed without one.
+        guard is the validation.HomographyGuard the homography of every frame after
+        the first must pass, relative to the reference, before it is composited, a
+        default one if None. frames that would take the canvas past max_canvas_bytes
+        are rejected too, there is no limit if None
+        """
+        assert registration in REGISTRATIONS, "unknown registration"
+        assert reanchor_interval > 0, "reanchor_interval must be positive"
+        assert canvas in CANVASES, "unknown canvas"
+        assert blend in BLENDS, "unknown blend"
+        assert seam in SEAMS, "unknown seam"
+        assert 0 < seam_scale <= 1, "seam_scale must be in (0, 1]"
+        assert exposure in EXPOSURES, "unknown exposure"
+        assert registration_mpx is None or registration_mpx > 0, "mpx must be positive"
+
         self.min_num = min_num
         self.lowe = lowe
         self.knn_clusters = knn_clusters
+        self.registration = registration
+        self.reanchor_interval = reanchor_interval
+        self.registration_mpx = registration_mpx
+        self.registration_scale = 1.0
 
-        self.flann = cv2.FlannBasedMatcher({"algorithm": 0, "trees": 5}, {"checks": 50})
-        self.sift = cv2.SIFT.create()
+        cache = FeatureCache(feature_cache) if feature_cache is not None else None
+        self.backend = FeatureBackend(features, matcher, cache)
+        self.matcher = self.backend.matcher
 
+        self.canvas_type = canvas
+        self.tile_size = tile_size
+        self.canvas_directory = canvas_directory
+        self.resident_tiles = resident_tiles
+        self.blend = blend
+        self.seam = seam
+        self.seam_scale = seam_scale
+        self.exposure = exposure
+        self.compensator = create_compensator(exposure)
+        self.footprints = []
+        self.canvas = self._create_canvas() if canvas is not None else None
+        self.reference = numpy.eye(3) if reference is None else reference
         self.result_image = None
-        self.result_image_gray = None
-        self.result_features = None
+        self.result_features = FeatureStore()
+        self.index = None
+        if persistent_index and hasattr(self.matcher, "build"):
+            self.index = FeatureIndex(self.matcher)
+
+        self.min_anchor_ratio = min_anchor_ratio
+        self.tracker = None
+        if registration == "flow":
+            self.tracker = FlowTracker(min_tracks=min_tracks)
+
+        self.previous_features = None
+        self.previous_to_result = None
+        self.frames_since_anchor = 0
+
+        self.frame_index = 0
+        self.registrations = []
+
+        self.tracer = tracer
+        self.trace = None
+
+        self.guard = HomographyGuard() if guard is None else guard
+        self.max_canvas_bytes = max_canvas_bytes
+        self.extent = None
 
     def add_image(self, image: numpy.ndarray):
         """
         this adds a new image to the stitched image by
         running feature extraction and matching them
         """
+        self._add(image)
+
+    def add_images(self, images, workers: int = 4, lookahead: int = None):
+        """
+        adds every image in order as add_image would, images is an iterable of
+        arrays or paths. the upcoming lookahead images are decoded and have their
+        features detected by a pool of worker threads, each with its own detector,
+        while the current image is registered and composited, with flow registration
+        they are only decoded ahead. unreadable paths are skipped
+        """
+        lookahead = 2 * workers if lookahead is None else lookahead
+        assert workers > 0, "workers must be positive"
+        assert lookahead > 0, "lookahead must be positive"
+
+        local = threading.local()
+
+        def prepare(item):
+            if not hasattr(local, "backend"):
+                local.backend = self.backend.clone()
+            image = item
+            if isinstance(item, (str, pathlib.Path)):
+                image = cv2.imread(str(item))
+                if image is None:
+                    logging.warning(f"skipping unreadable image {item}")
+                    return None
+            if self.tracker is not None:
+                return image, None, None
+            start = time.perf_counter()
+            features = self._features(image, local.backend)
+            return image, features, time.perf_counter() - start
+
+        def consume(future):
+            prepared = future.result()
+            if prepared is None:
+                return
+            image, features, detect_time = prepared
+            if features is None:
+                self._add(image)
+                return
+            points, descriptors, self.registration_scale = features
+            self._add(image, (points, descriptors), detect_time)
+
+        with ThreadPoolExecutor(workers) as pool:
+            pending = collections.deque()
+            for item in images:
+                pending.append(pool.submit(prepare, item))
+                if len(pending) >= lookahead:
+                    consume(pending.popleft())
+            while pending:
+                consume(pending.popleft())
+
+    def _add(self, image, image_features=None, detect_time: float = None):
+        """
+        registers and composites an image, its features are detected here unless
+        they were already, taking detect_time seconds, or it could be tracked
+        """
+        assert self.canvas is not None or numpy.array_equal(
+            self.reference, numpy.eye(3)
+        ), "reference needs a canvas"
+
+        with self._traced(detect_time):
+            located, image_features = self._track_or_locate(image, image_features)
+            self.frame_index += 1
+            if located is None:
+                logging.warning(
+                    "too few correspondences to add image to stitched image"
+                )
+            else:
+                located = self._guarded(image, located)
+            self._count(image_features, located)
+            if located is None:
+                return
+
+            image_to_result, anchored, n_matches, n_inliers = located
+
+            logging.debug("stitching images together")
+            image_to_result = self._composite(image, image_to_result)
+            self._accept(image, image_features, image_to_result, anchored)
+
+            if self.canvas is not None:
+                self._record(image, image_to_result, n_matches, n_inliers)
+
+    def register(self, image: numpy.ndarray):
+        """
+        first pass of the two-phase pipeline, this finds where the image sits in the
+        panorama without touching any pixels. returns its FrameRegistration or None
+        """
+        assert self.result_image is None, "can not register after add_image"
+
+        with self._traced():
+            located, image_features = self._track_or_locate(image)
+            self.frame_index += 1
+            if located is None:
+                logging.warning("too few correspondences to register image")
+            else:
+                located = self._guarded(image, located)
+            self._count(image_features, located)
+            if located is None:
+                return None
+
+            image_to_result, anchored, n_matches, n_inliers = located
+            self._accept(image, image_features, image_to_result, anchored)
+            return self._record(image, image_to_result, n_matches, n_inliers)
+
+    @contextlib.contextmanager
+    def _traced(self, detect_time: float = None):
+        """
+        traces the frame added in the with block when there is a tracer, detect_time
+        is how long its features took to detect if that was done elsewhere
+        """
+        if self.tracer is None:
+            yield
+            return
+
+        self.trace = self.tracer.begin(self.frame_index)
+        if detect_time is not None:
+            self.trace.add("detect", detect_time)
+        try:
+            yield
+        finally:
+            if self.canvas is not None and self.canvas.bounds() is not None:
+                x_min, y_min, x_max, y_max = self.canvas.bounds()
+                self.trace.count(
+                    canvas_width=x_max - x_min,
+                    canvas_height=y_max - y_min,
+                    canvas_bytes=self.canvas.nbytes,
+                )
+            elif self.result_image is not None:
+                self.trace.count(
+                    canvas_width=self.result_image.shape[1],
+                    canvas_height=self.result_image.shape[0],
+                    canvas_bytes=self.result_image.nbytes,
+                )
+            self.tracer.end(self.trace)
+            self.trace = None
+
+    def _guarded(self, image, located):
+        """
+        returns located, or None when its homography fails the guard or the frame
+        would take the canvas past its budget, the reason is counted and traced. the
+        first frame is placed by the reference rather than matched, only the budget
+        applies to it, later frames are checked relative to the reference
+        """
+        image_to_result, _, n_matches, n_inliers = located
+        reason = None
+        if self.previous_to_result is not None:
+            image_to_first = numpy.linalg.solve(self.reference, image_to_result)
+            reason = self.guard.check(image_to_first, image.shape, n_matches, n_inliers)
+        if reason is None and self.max_canvas_bytes is not None:
+            n_bytes = self._canvas_bytes(image, image_to_result)
+            if n_bytes > self.max_canvas_bytes:
+                logging.debug(f"the canvas would need {n_bytes / 2**20:.0f} MiB")
+                reason = "over the canvas budget"
+        if reason is None:
+            return located
+
+        self.guard.reject(reason)
+        if self.trace is not None:
+            self.trace.count(rejected=reason)
+        return None
+
+    def _canvas_bytes(self, image, image_to_result):
+        """
+        estimates the bytes the canvas and the warped frame would take once the image
+        is composited, the legacy and dense canvases hold the panorama's whole bounding
+        box whereas tiles are only allocated where frames land
+        """
+        corners = cv2.perspectiveTransform(image_corners(image.shape), image_to_result)
+        x_min, y_min = numpy.floor(corners.min(axis=0).ravel())
+        x_max, y_max = numpy.ceil(corners.max(axis=0).ravel())
+        channels = image.shape[2]
+        patch = (x_max - x_min) * (y_max - y_min)
+        # the warped patch and its mask
+        n_bytes = patch * (channels + 1)
+
+        if self.canvas_type == "disk":
+            return n_bytes
+        if self.canvas_type == "tiled":
+            # at most about as many new tiles as the patch covers
+            return n_bytes + self.canvas.nbytes + patch * channels
+
+        extent = self.extent
+        if self.result_image is not None:
+            extent = (0, 0, self.result_image.shape[1], self.result_image.shape[0])
+        elif self.canvas is not None:
+            extent = self.canvas.bounds()
+        if extent is not None:
+            x_min, y_min = min(x_min, extent[0]), min(y_min, extent[1])
+            x_max, y_max = max(x_max, extent[2]), max(y_max, extent[3])
+        return n_bytes + (x_max - x_min) * (y_max - y_min) * channels
+
+    def _count(self, image_features, located):
+        """counts the frame's keypoints, matches and inliers in its trace"""
+        if self.trace is None:
+            return
+        if image_features is not None:
+            self.trace.count(keypoints=len(image_features[0]))
+        if located is None:
+            self.trace.count(registered=False)
+            return
+        _, anchored, n_matches, n_inliers = located
+        self.trace.count(
+            registered=True,
+            tracked=image_features is None,
+            anchored=anchored,
+            matches=n_matches,
+            inliers=n_inliers,
+        )
+
+    def render(self, frames):
+        """
+        second pass of the two-phase pipeline, frames must be the images given to
+        register in the same order. the canvas is allocated once and every frame is
+        composited exactly once
+        """
+        return render_panorama(
+            frames,
+            self.registrations,
+            self._create_canvas(),
+            self.blend,
+            self.seam,
+            self.seam_scale,
+            create_compensator(self.exposure),
+        )
+
+    def _detect(self, image):
+        """returns the (points, descriptors) of the image"""
+        with stage(self.trace, "detect"):
+            points, descriptors, self.registration_scale = self._features(
+                image, self.backend
+            )
+        return points, descriptors
+
+    def _features(self, image, backend):
+        """
+        returns the (points, descriptors, scale) of the image found by the backend
+        at the registration resolution, without touching the stitcher's state
+        """
+        image_gray, scale = self._gray(image)
+        points, descriptors = backend.detect(image_gray)
+        return points / scale, descriptors, scale
+
+    def _gray(self, image):
+        """returns the gray image at the registration resolution and its scale"""
         assert image.ndim == 3, "must be an image!"
         assert image.shape[-1] == 3, "must be BGR!"
         assert image.dtype == numpy.uint8, "must be a uint8"
 
         image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
 
-        if self.result_image is None:
-            self.result_image = image
-            self.result_image_gray = image_gray
-            self.result_features = self.sift.detectAndCompute(
-                self.result_image_gray, None
+        scale = 1.0
+        if self.registration_mpx is not None:
+            pixels = image_gray.shape[0] * image_gray.shape[1]
+            scale = min(1.0, float(numpy.sqrt(self.registration_mpx * 1e6 / pixels)))
+        if scale < 1.0:
+            image_gray = cv2.resize(
+                image_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
             )
+        return image_gray, scale
+
+    def _track_or_locate(self, image, image_features=None):
+        """
+        returns (what _locate returns, the image's features), the features are None
+        when the image was located by tracking alone. when re-anchoring a tracked
+        image the panorama match is kept if it has enough inliers of its own, it is
+        not compared with the tracks it is there to correct
+        """
+        tracked = self._track(image)
+        reanchor = self.frames_since_anchor >= self.reanchor_interval
+        if tracked is not None and not reanchor:
+            return tracked, None
+
+        if image_features is None:
+            image_features = self._detect(image)
+        located = self._locate(image_features)
+        if tracked is None:
+            return located, image_features
+
+        if located is None or located[3] < max(
+            self.min_num, self.min_anchor_ratio * located[2]
+        ):
+            # not an anchor, so the next frame tries again. the features are dropped
+            # as they would be stored at the tracked pose, the one that drifted
+            logging.debug("re-anchoring failed, keeping the tracks")
+            return tracked, None
+        return (located[0], True, located[2], located[3]), image_features
+
+    def _track(self, image):
+        """
+        returns what _locate returns for an image located by tracking the previous
+        frame's corners into it, or None when tracking is off or lost
+        """
+        if self.tracker is None:
+            return None
+
+        image_gray, scale = self._gray(image)
+        self.tracker.prepare(image_gray)
+        if self.previous_to_result is None:
+            return None
+
+        with stage(self.trace, "track"):
+            tracks = self.tracker.track()
+        if tracks is None:
+            logging.debug("too few tracks survived, detecting features")
+            return None
+
+        self.registration_scale = scale
+        previous_points, points = tracks
+        logging.debug("computing homography between tracked points")
+        with stage(self.trace, "homography"):
+            homography, inliers = cv2.findHomography(
+                points / scale,
+                previous_points / scale,
+                cv2.RANSAC,
+                self._ransac_threshold(),
+            )
+        if homography is None or inliers.sum() < self.min_num:
+            return None
+        homography = self.previous_to_result.dot(homography)
+        return homography, False, len(points), int(inliers.sum())
+
+    def _locate(self, image_features):
+        """
+        returns (homography from the image to the panorama, whether it was matched
+        against the whole panorama, matches, inliers) or None if it could not be found
+        """
+        if self.previous_features is None:
+            n_features = len(image_features[0])
+            return self.reference, True, n_features, n_features
+
+        if (
+            self.registration == "frame"
+            and self.frames_since_anchor < self.reanchor_interval
+        ):
+            located = self._register_to_previous(image_features)
+            if located is not None:
+                return located[0], False, located[1], located[2]
+
+        located = self._register_to_result(image_features)
+        if located is not None:
+            return located[0], True, located[1], located[2]
+        return None
+
+    def _accept(self, image, image_features, image_to_result, anchored):
+        """
+        adds the image's features to the panorama and makes it the previous frame,
+        tracked images have no features and only move the tracker on
+        """
+        self.previous_to_result = image_to_result
+        self.frames_since_anchor = 0 if anchored else self.frames_since_anchor + 1
+        if self.tracker is not None:
+            self.tracker.accept(reseed=image_features is not None)
+        if image_features is None:
             return
 
-        image_features = self.sift.detectAndCompute(image_gray, None)
+        logging.debug("adding new features to the panorama")
+        with stage(self.trace, "store"):
+            frame_corners = cv2.perspectiveTransform(
+                image_corners(image.shape), image_to_result
+            )
+            frame_points = cv2.perspectiveTransform(
+                image_features[0].reshape(-1, 1, 2), image_to_result
+            )
+            self.result_features.prune(frame_corners)
+            self.result_features.append(frame_points, image_features[1])
+
+        self.previous_features = image_features
 
+    def _update_index(self):
+        """
+        brings the panorama index up to date with the stored features, only done
+        before it is searched so frame to frame registration does not pay for it
+        """
+        build_time = self.index.build_time
+        with stage(self.trace, "index"):
+            self.index.update(self.result_features)
+        build_time = self.index.build_time - build_time
+        logging.debug(f"panorama index took {build_time:.4f}s to update")
+
+    def _record(self, image, image_to_result, n_matches, n_inliers):
+        """keeps the FrameRegistration of the image for the render pass"""
+        corners = cv2.perspectiveTransform(image_corners(image.shape), image_to_result)
+        low, high = corners.min(axis=0).ravel(), corners.max(axis=0).ravel()
+        if self.extent is not None:
+            low = numpy.minimum(low, self.extent[:2])
+            high = numpy.maximum(high, self.extent[2:])
+        self.extent = (*numpy.floor(low).tolist(), *numpy.ceil(high).tolist())
+
+        registration = FrameRegistration(
+            index=self.frame_index - 1,
+            shape=image.shape[:2],
+            homography=image_to_result,
+            n_matches=n_matches,
+            n_inliers=n_inliers,
+        )
+        self.registrations.append(registration)
+        return registration
+
+    def _register_to_result(self, image_features):
+        """
+        returns (homography from the new image to the stitched image, matches, inliers)
+        or None
+        """
+        if self.index is not None:
+            self._update_index()
+            matches_src, matches_dst, n_matches = compute_index_matches(
+                self.result_features,
+                self.index,
+                image_features,
+                knn=self.knn_clusters,
+                lowe=self.lowe,
+                trace=self.trace,
+            )
+        else:
+            matches_src, matches_dst, n_matches = compute_matches(
+                self.result_features.features(),
+                image_features,
+                matcher=self.matcher,
+                knn=self.knn_clusters,
+                lowe=self.lowe,
+                trace=self.trace,
+            )
+
+        if n_matches < self.min_num:
+            return None
+
+        logging.debug("computing homography between accumulated and new images")
+        with stage(self.trace, "homography"):
+            homography, inliers = cv2.findHomography(
+                matches_dst, matches_src, cv2.RANSAC, self._ransac_threshold()
+            )
+        if homography is None:
+            return None
+        return homography, n_matches, int(inliers.sum())
+
+    def _register_to_previous(self, image_features):
+        """
+        returns (homography from the new image to the stitched image, matches, inliers)
+        or None, by matching against the previous frame and chaining through where it
+        sits in the panorama
+        """
         matches_src, matches_dst, n_matches = compute_matches(
-            self.result_features,
+            self.previous_features,
             image_features,
-            matcher=self.flann,
+            matcher=self.matcher,
             knn=self.knn_clusters,
             lowe=self.lowe,
+            trace=self.trace,
         )
 
         if n_matches < self.min_num:
-            logging.warning("too few correspondences to add image to stitched image")
-            return
+            logging.debug("too few frame to frame correspondences, re-anchoring")
+            return None
 
-        logging.debug("computing homography between accumulated and new images")
-        homography, _ = cv2.findHomography(matches_src, matches_dst, cv2.RANSAC, 5.0)
+        logging.debug("computing homography between previous and new images")
+        with stage(self.trace, "homography"):
+            homography, inliers = cv2.findHomography(
+                matches_dst, matches_src, cv2.RANSAC, self._ransac_threshold()
+            )
+        if homography is None:
+            return None
+        return self.previous_to_result.dot(homography), n_matches, int(inliers.sum())
+
+    def _composite(self, image, image_to_result):
+        """
+        draws the new image into the panorama and returns the homography from
+        the new image to the panorama's (possibly moved) coordinates
+        """
+        if self.canvas is not None:
+            with stage(self.trace, "warp"):
+                warped, mask, (x_min, y_min) = warp_image(image, image_to_result)
+            with stage(self.trace, "composite"):
+                write_blended(
+                    self.canvas,
+                    x_min,
+                    y_min,
+                    warped,
+                    mask,
+                    self.blend,
+                    self.footprints,
+                    self.seam,
+                    self.seam_scale,
+                    self.compensator,
+                )
+            self.footprints.append(
+                cv2.perspectiveTransform(image_corners(image.shape), image_to_result)
+            )
+            return image_to_result
+
+        if self.result_image is None:
+            self.result_image = image
+            return image_to_result
+
+        result_to_image = numpy.linalg.inv(image_to_result)
+        h_translation, _ = canvas_translation(image, self.result_image, result_to_image)
+        with stage(self.trace, "composite"):
+            self.result_image = combine_images(
+                image,
+                self.result_image,
+                result_to_image,
+                self.blend,
+                self.seam,
+                self.seam_scale,
+                self.compensator,
+            )
 
-        logging.debug("stitching images together")
-        self.result_image = combine_images(image, self.result_image, homography)
-        self.result_image_gray = cv2.cvtColor(self.result_image, cv2.COLOR_RGB2GRAY)
-        self.result_features = self.sift.detectAndCompute(self.result_image_gray, None)
+        logging.debug("moving accumulated features into the new panorama")
+        self.result_features.transform(h_translation.dot(result_to_image))
+        return h_translation
+
+    def _ransac_threshold(self):
+        """5 pixels at the resolution the features were detected at"""
+        return 5.0 / self.registration_scale
+
+    def _create_canvas(self):
+        """a new empty canvas of the configured type, dense if none was chosen"""
+        if self.canvas_type == "tiled":
+            return TiledCanvas(self.tile_size)
+        if self.canvas_type == "disk":
+            return DiskCanvas(
+                self.tile_size,
+                directory=self.canvas_directory,
+                max_resident=self.resident_tiles,
+            )
+        return DenseCanvas()
 
     def image(self):
         """class for fetching the stitched image"""
+        if self.canvas is not None:
+            return self.canvas.render()
         return self.result_image
@@ -0,0 +1,88 @@
+import cv2
+import numpy
+
+from .features import image_corners
+
+DOC = """helper functions for generating frame sequences with known homographies"""
+
+
+def synthetic_texture(height: int, width: int, seed: int = 0):
+    """
+    draws random filled circles and rectangles onto a black canvas,
+    this gives plenty of corners for the feature detectors to lock onto
+    """
+    rng = numpy.random.default_rng(seed)
+    img = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+
+    for _ in range(height * width // 400):
+        colour = tuple(int(c) for c in rng.integers(0, 255, 3))
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(3, 25))
+        if rng.random() < 0.5:
+            cv2.circle(img, (x, y), radius, colour, -1)
+        else:
+            cv2.rectangle(img, (x, y), (x + radius, y + radius // 2 + 2), colour, -1)
+
+    return cv2.GaussianBlur(img, (3, 3), 0)
+
+
+def panning_sequence(source, frame_size, n_frames: int, step=(40, 5), start=(10, 10)):
+    """
+    yields (frame, homography) pairs by cropping frame_size = (width, height)
+    windows that pan across the source, the homography maps source to frame
+    """
+    width, height = frame_size
+    for idx in range(n_frames):
+        x = start[0] + idx * step[0]
+        y = start[1] + idx * step[1]
+        h_matrix = numpy.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=numpy.float64)
+        yield cv2.warpPerspective(source, h_matrix, (width, height)), h_matrix
+
+
+def warped_sequence(
+    source,
+    frame_size,
+    n_frames: int,
+    step=(40, 5),
+    start=(10, 10),
+    jitter=(2.0, 0.03, 2e-5),
+    seed: int = 0,
+):
+    """
+    like panning_sequence but every frame is also rotated by up to jitter[0] degrees,
+    scaled by up to jitter[1] and tilted by up to jitter[2] of perspective about its
+    centre, so registration has to recover a full homography. start should leave
+    the source a margin for the corners to move into
+    """
+    rng = numpy.random.default_rng(seed)
+    width, height = frame_size
+    centre = numpy.array([[1, 0, width / 2], [0, 1, height / 2], [0, 0, 1]])
+    max_angle, max_scale, max_tilt = jitter
+
+    for idx in range(n_frames):
+        x = start[0] + idx * step[0]
+        y = start[1] + idx * step[1]
+        pan = numpy.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=numpy.float64)
+
+        angle = numpy.radians(rng.uniform(-max_angle, max_angle))
+        scale = 1 + rng.uniform(-max_scale, max_scale)
+        tilt = rng.uniform(-max_tilt, max_tilt, 2)
+        cos, sin = scale * numpy.cos(angle), scale * numpy.sin(angle)
+        warp = numpy.array([[cos, -sin, 0], [sin, cos, 0], [tilt[0], tilt[1], 1]])
+
+        h_matrix = centre.dot(warp).dot(numpy.linalg.inv(centre)).dot(pan)
+        h_matrix /= h_matrix[2, 2]
+        yield cv2.warpPerspective(source, h_matrix, (width, height)), h_matrix
+
+
+def relative_homography(source_to_from, source_to_to):
+    """the homography between two frames of a sequence, from one into the other"""
+    return source_to_to.dot(numpy.linalg.inv(source_to_from))
+
+
+def corner_error(estimated, truth, shape):
+    """mean distance in pixels between the frame corners mapped by both homographies"""
+    corners = image_corners(shape).astype(numpy.float64)
+    mapped_estimated = cv2.perspectiveTransform(corners, estimated)
+    mapped_truth = cv2.perspectiveTransform(corners, truth)
+    return float(numpy.linalg.norm(mapped_estimated - mapped_truth, axis=-1).mean())
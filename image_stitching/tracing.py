@@ -0,0 +1,116 @@
+import contextlib
+import csv
+import json
+import logging
+import pathlib
+import time
+
+DOC = """
+    per frame tracing of the stitcher, how long each stage took and how many
+    keypoints, matches and inliers it worked with. nothing is timed unless a
+    collector is given, so tracing costs next to nothing when it is off
+"""
+
+# shared by every untraced stage, entering it does nothing
+_UNTRACED = contextlib.nullcontext()
+
+
+def stage(trace, name: str):
+    """times the with block as the named stage of the trace, if there is one"""
+    if trace is None:
+        return _UNTRACED
+    return trace.stage(name)
+
+
+class FrameTrace:
+    DOC = """stage durations and counts of one frame"""
+
+    def __init__(self, index: int):
+        """constructor for the trace of frame index"""
+        self.index = index
+        self.durations = {}
+        self.counts = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """times the with block, repeated stages add up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        """adds a duration measured elsewhere, such as in a worker thread"""
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def count(self, **counts):
+        """sets counts such as keypoints=1200"""
+        self.counts.update(counts)
+
+    def record(self):
+        """the trace as a flat dict, durations in milliseconds"""
+        record = {"frame": self.index}
+        record.update(
+            {f"{name}_ms": 1000 * seconds for name, seconds in self.durations.items()}
+        )
+        record.update(self.counts)
+        return record
+
+
+class TraceCollector:
+    DOC = """keeps the record of every traced frame and passes each on to callbacks"""
+
+    def __init__(self, callbacks=()):
+        """
+        constructor for the collector, every callback is called with each frame's
+        record as a dict once the frame is done
+        """
+        self.callbacks = list(callbacks)
+        self.records = []
+
+    def begin(self, index: int):
+        """returns a new FrameTrace for frame index"""
+        return FrameTrace(index)
+
+    def end(self, trace: FrameTrace):
+        """keeps the finished trace's record and hands it to the callbacks"""
+        record = trace.record()
+        self.records.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def columns(self):
+        """every key of the records, in the order they first appear"""
+        columns = {}
+        for record in self.records:
+            columns.update(dict.fromkeys(record))
+        return list(columns)
+
+    def totals(self):
+        """total and mean milliseconds of each stage over the frames it ran in"""
+        totals = {}
+        for column in self.columns():
+            if not column.endswith("_ms"):
+                continue
+            values = [record[column] for record in self.records if column in record]
+            totals[column[:-3]] = {
+                "frames": len(values),
+                "total_ms": sum(values),
+                "mean_ms": sum(values) / len(values),
+            }
+        return totals
+
+    def export(self, path: pathlib.Path):
+        """writes the records to path as csv if it ends in .csv, json otherwise"""
+        path = pathlib.Path(path)
+        logging.info(f"writing trace of {len(self.records)} frames to {path}")
+        if path.suffix == ".csv":
+            with open(path, "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=self.columns())
+                writer.writeheader()
+                writer.writerows(self.records)
+            return
+
+        with open(path, "w") as file:
+            json.dump({"frames": self.records, "totals": self.totals()}, file, indent=2)
@@ -0,0 +1,111 @@
+import logging
+
+import cv2
+import numpy
+
+DOC = """
+    sparse pyramidal lucas-kanade tracking between consecutive video frames,
+    far cheaper than detecting and matching features in every frame
+"""
+
+
+class FlowTracker:
+    DOC = """tracks corners from the last accepted frame into the next one"""
+
+    def __init__(
+        self,
+        min_tracks: int = 100,
+        max_corners: int = 1000,
+        min_distance: int = 8,
+        win_size: int = 21,
+        levels: int = 3,
+        max_error: float = 1.0,
+    ):
+        """
+        constructor for the tracker, tracking gives up once fewer than min_tracks
+        points survive. corners are topped back up to max_corners once half are
+        lost and tracks whose forward-backward flow disagree by more than max_error
+        pixels are dropped
+        """
+        self.min_tracks = min_tracks
+        self.max_corners = max_corners
+        self.min_distance = min_distance
+        self.flow_params = {
+            "winSize": (win_size, win_size),
+            "maxLevel": levels,
+            "criteria": (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01),
+        }
+        self.max_error = max_error
+
+        self.gray = None
+        self.points = None
+        self.next_gray = None
+        self.next_points = None
+
+    def __len__(self):
+        return 0 if self.points is None else len(self.points)
+
+    def _corners(self, gray, existing=None):
+        """detects corners to track, away from any existing tracks"""
+        mask = None
+        n_corners = self.max_corners
+        if existing is not None and len(existing):
+            mask = numpy.full(gray.shape, 255, dtype=numpy.uint8)
+            for x, y in numpy.round(existing.reshape(-1, 2)).astype(int):
+                cv2.circle(mask, (x, y), self.min_distance, 0, -1)
+            n_corners -= len(existing)
+
+        corners = cv2.goodFeaturesToTrack(
+            gray, n_corners, 0.01, self.min_distance, mask=mask
+        )
+        if corners is None:
+            return numpy.empty((0, 1, 2), dtype=numpy.float32)
+        return corners.astype(numpy.float32)
+
+    def prepare(self, gray):
+        """sets the gray image the next call to track and accept refer to"""
+        self.next_gray = gray
+        self.next_points = None
+
+    def track(self):
+        """
+        returns the (points in the last accepted frame, points in the prepared frame)
+        of the tracks that survived, or None when there are fewer than min_tracks
+        """
+        if len(self) < self.min_tracks:
+            return None
+
+        points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.gray, self.next_gray, self.points, None, **self.flow_params
+        )
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            self.next_gray, self.gray, points, None, **self.flow_params
+        )
+        error = numpy.linalg.norm((back - self.points).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1)
+        good &= error < self.max_error
+
+        logging.debug(f"{good.sum()} of {len(self)} tracks survived")
+        if good.sum() < self.min_tracks:
+            return None
+
+        self.next_points = points[good]
+        return self.points[good], points[good]
+
+    def accept(self, reseed: bool = False):
+        """
+        makes the prepared frame the one tracked from, keeping its tracks unless
+        reseed is set or it was not tracked, in which case new corners are detected
+        """
+        if reseed or self.next_points is None:
+            points = self._corners(self.next_gray)
+        else:
+            points = self.next_points
+            if len(points) < self.max_corners // 2:
+                top_up = self._corners(self.next_gray, points)
+                points = numpy.concatenate((points, top_up), axis=0)
+
+        self.gray = self.next_gray
+        self.points = points
+        self.next_gray = None
+        self.next_points = None
@@ -0,0 +1,104 @@
+import collections
+import logging
+
+import cv2
+import numpy
+
+from .features import image_corners
+
+DOC = """
+    sanity checks run on a frame's homography before any pixels are touched, a
+    degenerate RANSAC result would otherwise warp the frame into a canvas large
+    enough to exhaust memory
+"""
+
+
+class HomographyGuard:
+    DOC = """rejects degenerate homographies and counts the frames rejected and why"""
+
+    def __init__(
+        self,
+        max_scale: float = 4.0,
+        max_aspect: float = 3.0,
+        min_inlier_ratio: float = 0.15,
+        min_inliers: int = 8,
+    ):
+        """
+        constructor for the guard, a frame may be scaled by at most max_scale either
+        way along any axis and stretched max_aspect times more along one axis than
+        the other. its warped area must stay within max_scale squared of its own and
+        at least min_inlier_ratio of its matches, and min_inliers, must be inliers
+        """
+        assert max_scale >= 1, "max_scale must be at least 1"
+        assert max_aspect >= 1, "max_aspect must be at least 1"
+
+        self.max_scale = max_scale
+        self.max_aspect = max_aspect
+        self.min_inlier_ratio = min_inlier_ratio
+        self.min_inliers = min_inliers
+        self.rejected = collections.Counter()
+
+    def check(self, homography, shape, n_matches: int = None, n_inliers: int = None):
+        """
+        returns why the homography taking a frame of shape into the panorama is
+        implausible, or None if it passes. costs tens of microseconds
+        """
+        if homography is None or not numpy.isfinite(homography).all():
+            return "not finite"
+        if abs(homography[2, 2]) < 1e-12:
+            return "singular"
+
+        if n_inliers is not None:
+            if n_inliers < self.min_inliers:
+                return "too few inliers"
+            if n_matches and n_inliers < self.min_inlier_ratio * n_matches:
+                return "low inlier ratio"
+
+        homography = homography / homography[2, 2]
+        # scale, shear and orientation come from the jacobian at the frame's centre,
+        # the raw top left block changes with where the frame sits in the panorama
+        center = numpy.array([shape[1] / 2, shape[0] / 2])
+        depth = homography[2, :2].dot(center) + homography[2, 2]
+        if depth <= 0:
+            return "behind the camera"
+        position = (homography[:2, :2].dot(center) + homography[:2, 2]) / depth
+        jacobian = (
+            homography[:2, :2] - numpy.outer(position, homography[2, :2])
+        ) / depth
+        singular_values = numpy.linalg.svd(jacobian, compute_uv=False)
+        if numpy.linalg.det(jacobian) <= 0:
+            return "mirrored"
+        if singular_values[0] > self.max_scale:
+            return "scaled up"
+        if singular_values[1] < 1 / self.max_scale:
+            return "scaled down"
+        if singular_values[0] > self.max_aspect * singular_values[1]:
+            return "sheared"
+
+        corners = image_corners(shape).reshape(-1, 2).astype(numpy.float64)
+        depths = corners.dot(homography[2, :2]) + homography[2, 2]
+        if (depths <= 0).any():
+            return "behind the camera"
+        warped = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), homography)
+        warped = warped.reshape(-1, 2).astype(numpy.float32)
+        if not cv2.isContourConvex(warped):
+            return "not convex"
+
+        area = cv2.contourArea(warped) / (shape[0] * shape[1])
+        if not 1 / self.max_scale**2 <= area <= self.max_scale**2:
+            return "area out of range"
+        return None
+
+    def reject(self, reason: str):
+        """counts a rejected frame"""
+        logging.warning(f"rejecting frame: {reason}")
+        self.rejected[reason] += 1
+
+    def summary(self):
+        """describes how many frames were rejected and why"""
+        if not self.rejected:
+            return "no frames rejected"
+        reasons = ", ".join(
+            f"{count} {reason}" for reason, count in self.rejected.most_common()
+        )
+        return f"rejected {sum(self.rejected.values())} frames: {reasons}"
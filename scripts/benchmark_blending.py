@@ -0,0 +1,87 @@
+import argparse
+import logging
+import time
+
+import numpy
+
+from image_stitching import ImageStitcher
+from image_stitching.blending import BLENDS
+from image_stitching.canvas import DenseCanvas
+from image_stitching.exposure import EXPOSURES, create_compensator
+from image_stitching.registration import render_panorama
+from image_stitching.seams import SEAMS
+from image_stitching.synthetic import panning_sequence, synthetic_texture
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Render time and visible seams of the blending, seam and "
+        "exposure modes"
+    )
+    parser.add_argument("--frames", default=12, type=int, help="Number of frames")
+    parser.add_argument("--width", default=1280, type=int, help="Frame width")
+    parser.add_argument("--height", default=720, type=int, help="Frame height")
+    parser.add_argument(
+        "--step", default=200, type=int, help="Horizontal pan per frame"
+    )
+    parser.add_argument(
+        "--gain", default=0.15, type=float, help="Exposure swing between frames"
+    )
+    return parser.parse_args()
+
+
+def seam_step(panorama, source):
+    """
+    how far the sharpest jump between neighbouring columns stands out from the
+    typical one, after removing the jumps the source itself has
+    """
+    width = min(panorama.shape[1], source.shape[1]) - 2
+    height = min(panorama.shape[0], source.shape[0])
+    jumps = numpy.abs(numpy.diff(panorama[:height, :width].astype(float), axis=1))
+    expected = numpy.abs(numpy.diff(source[:height, :width].astype(float), axis=1))
+    excess = (jumps - expected).mean(axis=(0, 2))
+    return float(excess.max() - numpy.median(excess))
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    width = args.width + args.step * args.frames + 20
+    source = synthetic_texture(args.height + 20, width)
+    frames = []
+    for idx, (frame, _) in enumerate(
+        panning_sequence(source, (args.width, args.height), args.frames, (args.step, 0))
+    ):
+        gain = 1 + args.gain * (1 if idx % 2 else -1)
+        frames.append(numpy.clip(frame * gain, 0, 255).astype(numpy.uint8))
+
+    stitcher = ImageStitcher()
+    for frame in frames:
+        stitcher.register(frame)
+    truth = source[10 : 10 + args.height, 10:]
+
+    modes = [(blend, seam, None) for seam in SEAMS for blend in BLENDS]
+    modes += [(blend, None, exposure) for exposure in EXPOSURES[1:] for blend in BLENDS]
+
+    print("blend      seam  exposure  ms/frame  seam step")
+    for blend, seam, exposure in modes:
+        begin = time.perf_counter()
+        panorama = render_panorama(
+            frames,
+            stitcher.registrations,
+            DenseCanvas(),
+            blend=blend,
+            seam=seam,
+            compensator=create_compensator(exposure),
+        )
+        elapsed = 1000 * (time.perf_counter() - begin) / len(frames)
+        step = seam_step(panorama, truth)
+        print(
+            f"{str(blend):10s} {str(seam):5s} {str(exposure):8s}"
+            f" {elapsed:9.1f} {step:10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from image_stitching.canvas import DenseCanvas, DiskCanvas, TiledCanvas
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Peak memory of each canvas for a long synthetic panorama"
+    )
+    parser.add_argument("--frames", default=200, type=int, help="Number of frames")
+    parser.add_argument("--width", default=1920, type=int, help="Frame width")
+    parser.add_argument("--height", default=1080, type=int, help="Frame height")
+    parser.add_argument(
+        "--step", default=400, type=int, help="Horizontal pan per frame"
+    )
+    parser.add_argument(
+        "--resident", default=64, type=int, help="Tiles the disk canvas keeps in memory"
+    )
+    return parser.parse_args()
+
+
+def run(canvas_type, args):
+    """composites the frames and exports them in a fresh process, returns its stats"""
+    canvases = {
+        "dense": lambda: DenseCanvas(),
+        "tiled": lambda: TiledCanvas(),
+        "disk": lambda: DiskCanvas(max_resident=args.resident),
+    }
+    canvas = canvases[canvas_type]()
+    frame = numpy.random.default_rng(0).integers(
+        0, 255, (args.height, args.width, 3), dtype=numpy.uint8
+    )
+
+    start = time.perf_counter()
+    for idx in range(args.frames):
+        canvas.write(idx * args.step, (idx % 7) * 10, frame)
+    written = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        if canvas_type == "disk":
+            canvas.export(f"{directory}/panorama.npy")
+        else:
+            numpy.save(f"{directory}/panorama.npy", canvas.render())
+        exported = time.perf_counter() - start
+
+    x_min, y_min, x_max, y_max = canvas.bounds()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return (x_max - x_min) * (y_max - y_min) / 1e6, written, exported, peak
+
+
+def main():
+    args = parse_args()
+
+    print("canvas   panorama mpx  write s  export s  peak rss mb")
+    for canvas_type in ("dense", "tiled", "disk"):
+        with ProcessPoolExecutor(1) as pool:
+            mpx, written, exported, peak = pool.submit(run, canvas_type, args).result()
+        print(
+            f"{canvas_type:8s} {mpx:12.1f} {written:8.2f} {exported:9.2f} {peak:12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
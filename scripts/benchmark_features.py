@@ -0,0 +1,106 @@
+import argparse
+import logging
+import pathlib
+import time
+
+import cv2
+import numpy
+
+from image_stitching import ImageStitcher
+from image_stitching.backends import FEATURES, MATCHERS
+from image_stitching.synthetic import corner_error, panning_sequence, synthetic_texture
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Throughput and accuracy of every feature backend"
+    )
+    parser.add_argument(
+        "--folders",
+        default=["outside_images", "sunny_open_camera", "sunny_phone_camera"],
+        nargs="*",
+        help="Image folders, each stitched in file name order",
+    )
+    parser.add_argument(
+        "--synthetic",
+        default=8,
+        type=int,
+        help="Frames in a synthetic sequence with ground truth, 0 to skip",
+    )
+    parser.add_argument("--features", default=list(FEATURES), nargs="+")
+    parser.add_argument("--matchers", default=list(MATCHERS), nargs="+")
+    return parser.parse_args()
+
+
+def load_folder(folder):
+    images = []
+    for path in sorted(pathlib.Path(folder).iterdir()):
+        image = cv2.imread(str(path))
+        if image is None:
+            logging.warning(f"skipping unreadable image {path}")
+            continue
+        images.append(image)
+    return images
+
+
+def run(features, matcher, frames, truths=None):
+    """registers the frames and returns per-frame timings and statistics"""
+    stitcher = ImageStitcher(features=features, matcher=matcher)
+
+    elapsed, inlier_ratios, errors = [], [], []
+    for idx, frame in enumerate(frames):
+        start = time.perf_counter()
+        registration = stitcher.register(frame)
+        elapsed.append(time.perf_counter() - start)
+
+        if registration is None or idx == 0:
+            continue
+        inlier_ratios.append(registration.n_inliers / registration.n_matches)
+        if truths is not None:
+            errors.append(
+                corner_error(registration.homography, truths[idx], frame.shape)
+            )
+
+    return {
+        "ms": 1000 * numpy.mean(elapsed),
+        "registered": len(stitcher.registrations),
+        "inliers": numpy.mean(inlier_ratios) if inlier_ratios else float("nan"),
+        "error": numpy.mean(errors) if errors else float("nan"),
+    }
+
+
+def synthetic_set(n_frames):
+    source = synthetic_texture(500, 640 + 60 * n_frames)
+    sequence = list(panning_sequence(source, (640, 480), n_frames, (60, 4)))
+    first = sequence[0][1]
+    truths = [first.dot(numpy.linalg.inv(h_matrix)) for _, h_matrix in sequence]
+    return [frame for frame, _ in sequence], truths
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    datasets = [(folder, load_folder(folder), None) for folder in args.folders]
+    if args.synthetic:
+        datasets.append(("synthetic", *synthetic_set(args.synthetic)))
+
+    print(
+        "dataset              features matcher   ms/frame  registered  inliers  err px"
+    )
+    for name, frames, truths in datasets:
+        if len(frames) < 2:
+            print(f"{name:20s} not enough readable images, run git lfs pull")
+            continue
+        for features in args.features:
+            for matcher in args.matchers:
+                stats = run(features, matcher, frames, truths)
+                print(
+                    f"{name:20s} {features:8s} {matcher:7s} {stats['ms']:10.1f}"
+                    f" {stats['registered']:5d}/{len(frames):<5d}"
+                    f" {stats['inliers']:8.2f} {stats['error']:7.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import logging
+import pathlib
+import tempfile
+import time
+
+import cv2
+
+from image_stitching import ImageStitcher
+from image_stitching.synthetic import corner_error, panning_sequence, synthetic_texture
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serial add_image against the pipelined add_images"
+    )
+    parser.add_argument("--frames", default=24, type=int, help="Number of frames")
+    parser.add_argument("--width", default=1280, type=int, help="Frame width")
+    parser.add_argument("--height", default=720, type=int, help="Frame height")
+    parser.add_argument(
+        "--workers",
+        default=[1, 2, 4, 8],
+        type=int,
+        nargs="+",
+        help="Worker thread counts to compare",
+    )
+    parser.add_argument("--canvas", default="dense", help="Canvas of the stitcher")
+    return parser.parse_args()
+
+
+def write_frames(directory, args):
+    """writes a synthetic pan to png files so decoding is part of the timing"""
+    source = synthetic_texture(args.height + 20, args.width + 80 * args.frames + 20)
+    sequence = panning_sequence(source, (args.width, args.height), args.frames, (80, 0))
+    paths = []
+    for idx, (frame, _) in enumerate(sequence):
+        path = pathlib.Path(directory) / f"frame{idx:04d}.png"
+        cv2.imwrite(str(path), frame)
+        paths.append(path)
+    return paths
+
+
+def serial(paths, canvas):
+    stitcher = ImageStitcher(canvas=canvas)
+    for path in paths:
+        stitcher.add_image(cv2.imread(str(path)))
+    return stitcher
+
+
+def pipelined(paths, canvas, workers):
+    stitcher = ImageStitcher(canvas=canvas)
+    stitcher.add_images(paths, workers=workers)
+    return stitcher
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_frames(directory, args)
+
+        start = time.perf_counter()
+        expected = serial(paths, args.canvas)
+        baseline = time.perf_counter() - start
+
+        # flann and ransac are randomised so even two serial runs differ slightly
+        print("mode         s/total  ms/frame  speedup  max diff px")
+        print(f"{'serial':12s} {baseline:7.2f} {1000 * baseline / len(paths):9.1f}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            stitcher = pipelined(paths, args.canvas, workers)
+            elapsed = time.perf_counter() - start
+
+            difference = max(
+                corner_error(a.homography, b.homography, a.shape)
+                for a, b in zip(stitcher.registrations, expected.registrations)
+            )
+            label = f"{workers} workers"
+            print(
+                f"{label:12s} {elapsed:7.2f} {1000 * elapsed / len(paths):9.1f}"
+                f" {baseline / elapsed:7.2f}x {difference:12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import logging
+import time
+
+import cv2
+import numpy
+
+from image_stitching import ImageStitcher
+from image_stitching.synthetic import panning_sequence, synthetic_texture
+
+
+class TimedMatcher:
+    """wraps a matcher and accumulates the time spent searching it"""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.elapsed = 0.0
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def knn_search(self, *args, **kwargs):
+        return self._timed(self.matcher.knn_search, *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._timed(self.matcher.search, *args, **kwargs)
+
+    def build(self, *args, **kwargs):
+        return self.matcher.build(*args, **kwargs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Per-frame registration latency for each registration strategy"
+    )
+    parser.add_argument(
+        "--source", type=str, help="Image to pan across, synthetic if unset"
+    )
+    parser.add_argument("--frames", default=60, type=int, help="Number of frames")
+    parser.add_argument("--width", default=480, type=int, help="Frame width")
+    parser.add_argument("--height", default=360, type=int, help="Frame height")
+    parser.add_argument("--step", default=24, type=int, help="Horizontal pan per frame")
+    parser.add_argument("--block", default=10, type=int, help="Frames averaged per row")
+    return parser.parse_args()
+
+
+def run(registration, frames):
+    stitcher = ImageStitcher(registration=registration)
+    stitcher.matcher = TimedMatcher(stitcher.matcher)
+    stitcher.index.matcher = stitcher.matcher
+
+    latencies = []
+    for frame, _ in frames:
+        searched, built = stitcher.matcher.elapsed, stitcher.index.build_time
+        start = time.perf_counter()
+        stitcher.add_image(frame)
+        latencies.append(
+            (
+                time.perf_counter() - start,
+                stitcher.matcher.elapsed - searched,
+                stitcher.index.build_time - built,
+            )
+        )
+
+    return numpy.array(latencies), stitcher.image().shape
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.source:
+        source = cv2.imread(args.source)
+    else:
+        width = args.width + args.step * args.frames + 20
+        source = synthetic_texture(args.height + 20, width)
+
+    frames = list(
+        panning_sequence(source, (args.width, args.height), args.frames, (args.step, 0))
+    )
+
+    for registration in ("canvas", "frame", "flow"):
+        latencies, shape = run(registration, frames)
+        print(f"registration={registration} panorama={shape[1]}x{shape[0]}")
+        print("frames       add_image ms   search ms   index build ms")
+        for start in range(1, len(latencies), args.block):
+            block = latencies[start : start + args.block] * 1000
+            total, match, build = block.mean(axis=0)
+            print(
+                f"{start:4d}-{start + len(block) - 1:<6d}"
+                f" {total:12.2f} {match:11.2f} {build:16.2f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import logging
+import time
+
+import cv2
+import numpy
+
+from image_stitching import ImageStitcher
+from image_stitching.synthetic import corner_error, panning_sequence, synthetic_texture
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Speed and accuracy of registration at reduced resolution"
+    )
+    parser.add_argument(
+        "--source", type=str, help="Image to pan across, synthetic if unset"
+    )
+    parser.add_argument("--frames", default=6, type=int, help="Number of frames")
+    parser.add_argument("--width", default=1280, type=int, help="Frame width")
+    parser.add_argument("--height", default=720, type=int, help="Frame height")
+    parser.add_argument(
+        "--step", default=120, type=int, help="Horizontal pan per frame"
+    )
+    parser.add_argument(
+        "--mpx",
+        default=[0, 1.0, 0.6, 0.3, 0.1],
+        type=float,
+        nargs="+",
+        help="Registration megapixels to compare, 0 for native resolution",
+    )
+    return parser.parse_args()
+
+
+def run(registration_mpx, frames):
+    stitcher = ImageStitcher(registration_mpx=registration_mpx or None)
+    first_to_source = numpy.linalg.inv(frames[0][1])
+
+    elapsed, errors = [], []
+    for frame, source_to_frame in frames:
+        start = time.perf_counter()
+        registration = stitcher.register(frame)
+        elapsed.append(time.perf_counter() - start)
+
+        if registration is not None:
+            truth = numpy.linalg.inv(first_to_source).dot(
+                numpy.linalg.inv(source_to_frame)
+            )
+            errors.append(corner_error(registration.homography, truth, frame.shape))
+
+    return numpy.array(elapsed), numpy.array(errors), stitcher.registration_scale
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.source:
+        source = cv2.imread(args.source)
+    else:
+        width = args.width + args.step * args.frames + 20
+        source = synthetic_texture(args.height + 20, width)
+
+    frames = list(
+        panning_sequence(source, (args.width, args.height), args.frames, (args.step, 0))
+    )
+
+    print("mpx     scale   ms/frame  speedup  registered  mean err px  max err px")
+    baseline = None
+    for mpx in args.mpx:
+        elapsed, errors, scale = run(mpx, frames)
+        ms = 1000 * elapsed[1:].mean()
+        baseline = baseline or ms
+        label = f"{mpx:.2f}" if mpx else "native"
+        mean_error = errors.mean() if len(errors) else float("nan")
+        max_error = errors.max() if len(errors) else float("nan")
+        print(
+            f"{label:7s} {scale:5.3f} {ms:10.1f} {baseline / ms:8.1f}x"
+            f" {len(errors):5d}/{len(frames):<5d} {mean_error:11.3f} {max_error:11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import argparse
+import datetime
+import json
+import logging
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy
+
+from image_stitching import ImageStitcher
+from image_stitching.backends import FeatureBackend
+from image_stitching.combine import canvas_translation, combine_images, compute_matches
+from image_stitching.synthetic import (
+    corner_error,
+    relative_homography,
+    synthetic_texture,
+    warped_sequence,
+)
+from image_stitching.tracing import TraceCollector
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Times detection, compute_matches, combine_images and add_image "
+        "on synthetic sequences with known homographies and checks what they recover"
+    )
+    parser.add_argument(
+        "--source", type=str, help="Image to crop frames from, synthetic if unset"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=["480x360", "1280x720"],
+        nargs="+",
+        help="Frame sizes as WIDTHxHEIGHT",
+    )
+    parser.add_argument(
+        "--lengths", default=[10, 30], type=int, nargs="+", help="Sequence lengths"
+    )
+    parser.add_argument(
+        "--overlap", default=0.7, type=float, help="Overlap of consecutive frames"
+    )
+    parser.add_argument("--canvas", default="dense", help="Canvas of the stitcher")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the jitter")
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        type=str,
+        help="Path to write the results to",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Results of an earlier run to compare against, exits with 1 on a "
+        "regression",
+    )
+    parser.add_argument(
+        "--tolerance",
+        default=0.2,
+        type=float,
+        help="Fraction a median time may grow by before it counts as a regression",
+    )
+    return parser.parse_args()
+
+
+def timings(elapsed):
+    """summary of a list of durations in seconds, in milliseconds"""
+    elapsed = 1000 * numpy.asarray(elapsed)
+    return {
+        "n": int(len(elapsed)),
+        "ms_mean": float(elapsed.mean()),
+        "ms_median": float(numpy.median(elapsed)),
+        "ms_p95": float(numpy.percentile(elapsed, 95)),
+    }
+
+
+def errors(values):
+    """mean and max corner errors in pixels, nan when nothing was recovered"""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if not len(values):
+        return {"corner_error_mean": float("nan"), "corner_error_max": float("nan")}
+    return {
+        "corner_error_mean": float(values.mean()),
+        "corner_error_max": float(values.max()),
+    }
+
+
+def make_frames(source, size, length, overlap, seed):
+    """a jittered pan across source, which is tiled when it is too small"""
+    width, height = size
+    step = max(1, int(width * (1 - overlap)))
+    margin = max(width, height) // 20
+    needed = (height + 2 * margin, width + step * length + 2 * margin)
+    if source is None:
+        source = synthetic_texture(*needed)
+    elif source.shape[0] < needed[0] or source.shape[1] < needed[1]:
+        reps = (-(-needed[0] // source.shape[0]), -(-needed[1] // source.shape[1]), 1)
+        source = numpy.tile(source, reps)
+    sequence = warped_sequence(
+        source, size, length, (step, 0), (margin, margin), seed=seed
+    )
+    return list(sequence), source
+
+
+def bench_detect(frames, backend):
+    elapsed, features = [], []
+    for frame, _ in frames:
+        image_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        start = time.perf_counter()
+        features.append(backend.detect(image_gray))
+        elapsed.append(time.perf_counter() - start)
+    stage = timings(elapsed)
+    stage["keypoints_mean"] = float(numpy.mean([len(points) for points, _ in features]))
+    return stage, features
+
+
+def bench_matches(frames, features, backend):
+    """matches each frame to the one before, the homography is checked on the side"""
+    elapsed, n_matches, errors_px = [], [], []
+    for idx in range(1, len(frames)):
+        start = time.perf_counter()
+        src, dst, count = compute_matches(
+            features[idx - 1], features[idx], backend.matcher, knn=2, lowe=0.7
+        )
+        elapsed.append(time.perf_counter() - start)
+        n_matches.append(count)
+
+        if count < 4:
+            continue
+        homography, _ = cv2.findHomography(dst, src, cv2.RANSAC, 5.0)
+        if homography is None:
+            continue
+        truth = relative_homography(frames[idx][1], frames[idx - 1][1])
+        errors_px.append(corner_error(homography, truth, frames[idx][0].shape))
+
+    stage = timings(elapsed)
+    stage["matches_mean"] = float(numpy.mean(n_matches))
+    stage["recovered"] = len(errors_px)
+    stage.update(errors(errors_px))
+    return stage
+
+
+def bench_combine(frames, source):
+    """
+    combines each frame with the one before through the true homography, the result
+    is compared with the source warped into the same place
+    """
+    elapsed, rms = [], []
+    for idx in range(1, len(frames)):
+        image, source_to_image = frames[idx]
+        previous, source_to_previous = frames[idx - 1]
+        previous_to_image = relative_homography(source_to_previous, source_to_image)
+
+        start = time.perf_counter()
+        combined = combine_images(image, previous, previous_to_image)
+        elapsed.append(time.perf_counter() - start)
+
+        h_translation, _ = canvas_translation(image, previous, previous_to_image)
+        size = (combined.shape[1], combined.shape[0])
+        truth = cv2.warpPerspective(source, h_translation.dot(source_to_image), size)
+        drawn = combined.any(axis=-1) & truth.any(axis=-1)
+        difference = combined[drawn].astype(numpy.float64) - truth[drawn]
+        rms.append(float(numpy.sqrt((difference**2).mean())))
+
+    stage = timings(elapsed)
+    stage["rms_mean"] = float(numpy.mean(rms))
+    return stage
+
+
+def bench_add_image(frames, canvas):
+    """
+    feeds every frame to a stitcher, the registrations are in the first frame's
+    coordinates and are checked against the true homographies. the stitcher is
+    traced so the time is also broken down by stage
+    """
+    tracer = TraceCollector()
+    stitcher = ImageStitcher(canvas=canvas, tracer=tracer)
+    elapsed = []
+    for frame, _ in frames:
+        start = time.perf_counter()
+        stitcher.add_image(frame)
+        elapsed.append(time.perf_counter() - start)
+
+    errors_px = []
+    for registration in stitcher.registrations:
+        frame, source_to_frame = frames[registration.index]
+        truth = relative_homography(source_to_frame, frames[0][1])
+        errors_px.append(corner_error(registration.homography, truth, frame.shape))
+
+    stage = timings(elapsed[1:] if len(elapsed) > 1 else elapsed)
+    stage["registered"] = len(stitcher.registrations)
+    stage.update(errors(errors_px))
+    stage["stages_ms"] = {
+        name: totals["mean_ms"] for name, totals in tracer.totals().items()
+    }
+    panorama = stitcher.image()
+    stage["panorama"] = [int(size) for size in panorama.shape[:2]]
+    return stage
+
+
+def environment(args):
+    """what the results were measured with"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "source": args.source or "synthetic",
+        "seed": args.seed,
+        "overlap": args.overlap,
+        "canvas": args.canvas,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """prints median times against the baseline, returns the regressed stages"""
+    earlier = {
+        (case["width"], case["height"], case["frames"]): case
+        for case in baseline["cases"]
+    }
+    regressions = []
+    print(f"\ncompared with {baseline['environment'].get('commit')}")
+    for case in results["cases"]:
+        key = (case["width"], case["height"], case["frames"])
+        if key not in earlier:
+            continue
+        for name, stage in case["stages"].items():
+            before = earlier[key]["stages"].get(name)
+            if before is None:
+                continue
+            ratio = stage["ms_median"] / max(before["ms_median"], 1e-9)
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSION"
+                regressions.append((key, name))
+            print(
+                f"{key[0]}x{key[1]} x{key[2]:<4d} {name:16s}"
+                f" {before['ms_median']:9.2f} -> {stage['ms_median']:9.2f} ms"
+                f" {ratio:6.2f}x{flag}"
+            )
+    return regressions
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    source = cv2.imread(args.source) if args.source else None
+    backend = FeatureBackend()
+    results = {"environment": environment(args), "cases": []}
+
+    print("size       frames  stage             median ms   mean ms  corner err px")
+    for size_text in args.sizes:
+        size = tuple(int(value) for value in size_text.lower().split("x"))
+        for length in args.lengths:
+            frames, case_source = make_frames(
+                source, size, length, args.overlap, args.seed
+            )
+            detect, features = bench_detect(frames, backend)
+            stages = {
+                "detect": detect,
+                "compute_matches": bench_matches(frames, features, backend),
+                "combine_images": bench_combine(frames, case_source),
+                "add_image": bench_add_image(frames, args.canvas),
+            }
+            results["cases"].append(
+                {
+                    "width": size[0],
+                    "height": size[1],
+                    "frames": length,
+                    "stages": stages,
+                }
+            )
+
+            for name, stage in stages.items():
+                error = stage.get("corner_error_mean")
+                error_text = "" if error is None else f"{error:13.3f}"
+                print(
+                    f"{size_text:10s} {length:6d}  {name:16s}"
+                    f" {stage['ms_median']:9.2f} {stage['ms_mean']:9.2f} {error_text}"
+                )
+            breakdown = ", ".join(
+                f"{name} {ms:.1f}"
+                for name, ms in stages["add_image"]["stages_ms"].items()
+            )
+            print(f"{'':18s} add_image ms by stage: {breakdown}")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
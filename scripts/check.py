@@ -3,6 +3,12 @@ import os
 import cv2
 import numpy as np
 
+from image_stitching.cache import FeatureCache
+
+# Cache detected features between runs, keyed by image content
+cache = FeatureCache("feature_cache")
+config = f"sift opencv {cv2.__version__}"
+
 
 def stitch_images(images):
     # Initialize feature detector (SIFT)
@@ -16,14 +22,16 @@ def stitch_images(images):
 
     # Initialize feature detector (SIFT) for the first image
     gray_first = cv2.cvtColor(images[0], cv2.COLOR_BGR2GRAY)
-    keypoints_first, descriptors_first = detector.detectAndCompute(gray_first, None)
+    keypoints_first, descriptors_first = cache.detect_and_compute(
+        detector, gray_first, config
+    )
     descriptors = [descriptors_first]
     locations = [keypoints_first]
 
     for i in range(1, len(images)):
         # Initialize feature detector (SIFT) for the current image
         gray = cv2.cvtColor(images[i], cv2.COLOR_BGR2GRAY)
-        keypoints, descriptor = detector.detectAndCompute(gray, None)
+        keypoints, descriptor = cache.detect_and_compute(detector, gray, config)
 
         # Match the descriptors with the previous image
         matches = matcher.knnMatch(descriptor, descriptors[-1], k=2)
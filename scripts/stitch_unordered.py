@@ -0,0 +1,140 @@
+import argparse
+import logging
+import pathlib
+
+import cv2
+
+from image_stitching import ImageStitcher
+from image_stitching.backends import FEATURES, MATCHERS
+from image_stitching.exposure import create_compensator
+from image_stitching.graph import match_graph
+from image_stitching.registration import render_panorama
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Stitch an unordered folder of images using a match graph"
+    )
+    parser.add_argument("folder", type=str, help="Folder of images in any order")
+    parser.add_argument("--display", action="store_true", help="Display result")
+    parser.add_argument(
+        "--save-path",
+        default="panorama.png",
+        type=str,
+        help="Path to save result",
+    )
+    parser.add_argument(
+        "--graph",
+        type=str,
+        help="Path to export the match graph to, .dot for graphviz otherwise json",
+    )
+    parser.add_argument("--features", default="sift", choices=FEATURES)
+    parser.add_argument("--matcher", default="flann", choices=MATCHERS)
+    parser.add_argument(
+        "--feature-cache",
+        type=str,
+        help="Directory to cache detected features in between runs",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes matching pairs, every core if unset"
+    )
+    parser.add_argument(
+        "--blend",
+        choices=["feather", "multiband"],
+        help="Blend images where they overlap instead of pasting",
+    )
+    parser.add_argument(
+        "--seam",
+        choices=["dp"],
+        help="Join images along the seam where they differ least, so moving objects "
+        "are not ghosted",
+    )
+    parser.add_argument(
+        "--seam-scale",
+        default=0.25,
+        type=float,
+        help="Scale of the overlap the seam is searched at",
+    )
+    parser.add_argument(
+        "--exposure",
+        choices=["gain", "blocks"],
+        help="Match each image's brightness to the panorama where they overlap, with "
+        "one gain per image or a grid of them",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help="Feed ImageStitcher in spanning tree order instead of rendering the "
+        "spanning tree homographies directly",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    paths = sorted(
+        path
+        for path in pathlib.Path(args.folder).iterdir()
+        if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES
+    )
+    assert paths, f"no images in {args.folder}"
+    graph = match_graph(
+        paths,
+        features=args.features,
+        matcher=args.matcher,
+        workers=args.workers,
+        feature_cache=args.feature_cache,
+    )
+
+    if args.graph:
+        export = graph.to_dot if args.graph.endswith(".dot") else graph.to_json
+        export(args.graph)
+
+    components = graph.components()
+    if len(components) > 1:
+        logging.warning(
+            f"{len(components) - 1} groups of images do not overlap the largest one, "
+            f"stitching {len(components[0])} of {len(paths)} images"
+        )
+
+    order = graph.stitch_order()
+    logging.info(f"stitch order {[paths[idx].name for idx in order]}")
+
+    if args.sequential:
+        stitcher = ImageStitcher(
+            features=args.features,
+            matcher=args.matcher,
+            blend=args.blend,
+            seam=args.seam,
+            seam_scale=args.seam_scale,
+            exposure=args.exposure,
+            feature_cache=args.feature_cache,
+        )
+        stitcher.add_images([paths[idx] for idx in order])
+        result = stitcher.image()
+    else:
+        frames = (cv2.imread(str(path)) for path in paths)
+        result = render_panorama(
+            frames,
+            graph.registrations(),
+            blend=args.blend,
+            seam=args.seam,
+            seam_scale=args.seam_scale,
+            compensator=create_compensator(args.exposure),
+        )
+
+    if args.display:
+        cv2.imshow("result", result)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+
+    logging.info(f"Saving final image to {args.save_path}")
+    cv2.imwrite(args.save_path, result)
+
+
+if __name__ == "__main__":
+    main()
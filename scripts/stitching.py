@@ -1,11 +1,18 @@
 import argparse
 import logging
 import pathlib
+import time
 
 import cv2
 
 from image_stitching import ImageStitcher
-from image_stitching.helpers import load_frames, save_frames_as_images
+from image_stitching.backends import FEATURES, MATCHERS
+from image_stitching.canvas import EXPORT_SUFFIXES
+from image_stitching.helpers import stream_frames
+from image_stitching.keyframes import KeyframeSelector
+from image_stitching.quality import QualityGate
+from image_stitching.stitcher import REGISTRATIONS
+from image_stitching.tracing import TraceCollector
 
 
 def parse_args():
@@ -21,7 +28,110 @@ def parse_args():
         "--save-path",
         default="panorama.png",
         type=str,
-        help="Path to save result",
+        help="Path to save result, the disk canvas only writes .ppm or .npy and "
+        "saves any other suffix as .ppm",
+    )
+    parser.add_argument(
+        "--features",
+        default="sift",
+        choices=FEATURES,
+        help="Feature detector used for registration",
+    )
+    parser.add_argument(
+        "--matcher",
+        default="flann",
+        choices=MATCHERS,
+        help="flann (KD-tree or LSH) or brute force matching",
+    )
+    parser.add_argument(
+        "--feature-cache",
+        type=str,
+        help="Directory to cache detected features in, re-runs on the same video "
+        "load them instead of detecting again",
+    )
+    parser.add_argument(
+        "--max-canvas-mb",
+        type=float,
+        help="Reject frames that would grow the panorama past this many megabytes",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        help="Path to write per frame stage timings and counts to, csv if it ends "
+        "in .csv otherwise json",
+    )
+    parser.add_argument(
+        "--registration",
+        default="canvas",
+        choices=REGISTRATIONS,
+        help="flow tracks frames with optical flow and only detects to re-anchor",
+    )
+    parser.add_argument(
+        "--canvas",
+        choices=["dense", "tiled", "disk"],
+        help="Fixed panorama canvas, disk keeps it out of memory and saves .npy or "
+        "any other suffix as ppm, the panorama is re-warped per frame if unset",
+    )
+    parser.add_argument(
+        "--blend",
+        choices=["feather", "multiband"],
+        help="Blend frames where they overlap instead of pasting over the panorama",
+    )
+    parser.add_argument(
+        "--seam",
+        choices=["dp"],
+        help="Join frames along the seam where they differ least, so moving objects "
+        "are not ghosted",
+    )
+    parser.add_argument(
+        "--seam-scale",
+        default=0.25,
+        type=float,
+        help="Scale of the overlap the seam is searched at",
+    )
+    parser.add_argument(
+        "--exposure",
+        choices=["gain", "blocks"],
+        help="Match each frame's brightness to the panorama where they overlap, with "
+        "one gain per frame or a grid of them",
+    )
+    parser.add_argument(
+        "--canvas-directory",
+        type=str,
+        help="Where the disk canvas keeps its tiles, the temporary directory if unset",
+    )
+    parser.add_argument(
+        "--queue-size",
+        default=8,
+        type=int,
+        help="Decoded frames buffered ahead of feature detection",
+    )
+    parser.add_argument(
+        "--dump-frames",
+        type=str,
+        help="Directory to also save every decoded frame to, for debugging",
+    )
+    parser.add_argument(
+        "--sharpest-of",
+        type=int,
+        help="Only stitch the sharpest frame of every this many, every frame if unset",
+    )
+    parser.add_argument(
+        "--min-sharpness",
+        type=float,
+        help="Drop frames whose laplacian variance is below this, scores are logged",
+    )
+    parser.add_argument(
+        "--keyframe-overlap",
+        type=float,
+        help="Only stitch keyframes overlapping each other by about this fraction, "
+        "every frame is stitched if unset",
+    )
+    parser.add_argument(
+        "--workers",
+        default=4,
+        type=int,
+        help="Threads detecting features ahead of stitching",
     )
     return parser.parse_args()
 
@@ -30,18 +140,59 @@ def main():
     args = parse_args()
     logging.basicConfig(level=logging.INFO)
 
-    # Create an output directory for saving frames as images
-    image_output_dir = pathlib.Path("frames")
-    image_output_dir.mkdir(parents=True, exist_ok=True)
+    tracer = TraceCollector() if args.trace else None
+    stitcher = ImageStitcher(
+        registration=args.registration,
+        canvas=args.canvas,
+        canvas_directory=args.canvas_directory,
+        blend=args.blend,
+        seam=args.seam,
+        seam_scale=args.seam_scale,
+        exposure=args.exposure,
+        features=args.features,
+        matcher=args.matcher,
+        feature_cache=args.feature_cache,
+        tracer=tracer,
+        max_canvas_bytes=(
+            int(args.max_canvas_mb * 2**20) if args.max_canvas_mb else None
+        ),
+    )
+
+    # Decode frames in the background and detect features ahead of stitching
+    frames = stream_frames(args.video_path, args.queue_size, args.dump_frames)
+    gate = None
+    if args.sharpest_of or args.min_sharpness is not None:
+        gate = QualityGate(args.sharpest_of or 1, args.min_sharpness)
+        frames = gate.select(frames)
 
-    # Call the function to save frames as images
-    save_frames_as_images(args.video_path, image_output_dir)
+    selector = None
+    if args.keyframe_overlap:
+        selector = KeyframeSelector(args.keyframe_overlap)
+        frames = selector.select(frames)
 
-    stitcher = ImageStitcher()
+    start = time.perf_counter()
+    stitcher.add_images(frames, workers=args.workers)
+    if gate is not None:
+        logging.info(gate.summary())
+    if selector is not None:
+        logging.info(selector.summary(time.perf_counter() - start))
+    if stitcher.backend.cache is not None:
+        logging.info(stitcher.backend.cache.summary())
+    logging.info(stitcher.guard.summary())
+    if tracer is not None:
+        tracer.export(args.trace)
 
-    # Call the function to load and process saved frames
-    for frame in load_frames(image_output_dir):
-        stitcher.add_image(frame)
+    if args.canvas == "disk":
+        # the panorama may not fit in memory so it is streamed straight to disk
+        if args.save:
+            save_path = pathlib.Path(args.save_path)
+            if save_path.suffix.lower() not in EXPORT_SUFFIXES:
+                save_path = save_path.with_suffix(".ppm")
+                logging.warning(f"the disk canvas can not write {args.save_path}")
+            logging.info(f"Exporting final image to {save_path}")
+            stitcher.canvas.export(save_path)
+        stitcher.canvas.close()
+        return
 
     result = stitcher.image()
 
@@ -1,6 +1,5 @@
 import concurrent.futures
 import os
-import random
 from operator import sub
 from sys import exit
 
@@ -31,6 +30,9 @@ RESDIR = "results/"
 
 METHODS = ["left-to-right", "middle-out", "first-out-then-middle"]
 
+WARP_TILE = 1024  # side of the output tiles warpImage maps at a time
+WARP_MAX_PIXELS = 1e8  # do not exceed 300 MB of output for 8 GB RAM
+
 ################################################################################
 # Save and load data                                                           #
 ################################################################################
@@ -199,43 +201,81 @@ def random_points(size, K):
 ################################################################################
 
 
-def computeH(src_pts, dst_pts, max_iter=1000, inlier_thr=5):
+# Hartley normalization, centroid to the origin and average distance sqrt(2)
+def normalize_points(pts):
+    pts = np.asarray(pts, dtype=np.float64)
+    mean = np.mean(pts, axis=0)
+    var = pts - mean
+    coef = np.sqrt(2) / max(np.mean(np.sqrt(np.sum(np.square(var), axis=1))), 1e-12)
+    # pts_n = C * T * pts
+    CT = np.array([[coef, 0, -coef * mean[0]], [0, coef, -coef * mean[1]], [0, 0, 1]])
+    return coef * var, CT
+
+
+# RANSAC iterations needed to draw one all-inlier sample with the given confidence
+# confidence=1 never stops early
+def ransac_iterations(inlier_ratio, confidence, max_iter):
+    if inlier_ratio <= 0 or confidence >= 1:
+        return max_iter
+    outlier = 1 - inlier_ratio**4
+    if outlier <= 0:
+        return 0
+    return min(max_iter, int(np.ceil(np.log(1 - confidence) / np.log(outlier))))
+
+
+def computeH(
+    src_pts, dst_pts, max_iter=1000, inlier_thr=5, confidence=0.995, batch=128
+):
     assert len(src_pts) >= 4
     assert len(dst_pts) == len(src_pts)
-    # apply RANSAC algorithm
+    assert 0 < confidence <= 1
+    src_pts = np.asarray(src_pts, dtype=np.float64)
+    dst_pts = np.asarray(dst_pts, dtype=np.float64)
+    n_pts = len(src_pts)
+    # the DLT is solved on normalized points, scoring stays in pixels
+    src_n, CT1 = normalize_points(src_pts)
+    dst_n, CT2 = normalize_points(dst_pts)
+    CT2_inv = np.linalg.inv(CT2)
+    src_h = np.pad(src_pts, [(0, 0), (0, 1)], constant_values=1).T
+    # apply RANSAC algorithm, a batch of hypotheses at a time
     best_inlier = 0  # number of points that are below threshold
     best_dist = float("inf")
-    for _ in range(max_iter):
-        # pick 4 random point pairs
-        idx = random.sample(range(len(src_pts)), 4)
-        # calculate homography matrix
-        x1, x2, x3, x4 = ((src_pts[i][0], dst_pts[i][0]) for i in idx)
-        y1, y2, y3, y4 = ((src_pts[i][1], dst_pts[i][1]) for i in idx)
-        P = np.array(
-            [
-                [-x1[0], -y1[0], -1, 0, 0, 0, x1[0] * x1[1], y1[0] * x1[1], x1[1]],
-                [0, 0, 0, -x1[0], -y1[0], -1, x1[0] * y1[1], y1[0] * y1[1], y1[1]],
-                [-x2[0], -y2[0], -1, 0, 0, 0, x2[0] * x2[1], y2[0] * x2[1], x2[1]],
-                [0, 0, 0, -x2[0], -y2[0], -1, x2[0] * y2[1], y2[0] * y2[1], y2[1]],
-                [-x3[0], -y3[0], -1, 0, 0, 0, x3[0] * x3[1], y3[0] * x3[1], x3[1]],
-                [0, 0, 0, -x3[0], -y3[0], -1, x3[0] * y3[1], y3[0] * y3[1], y3[1]],
-                [-x4[0], -y4[0], -1, 0, 0, 0, x4[0] * x4[1], y4[0] * x4[1], x4[1]],
-                [0, 0, 0, -x4[0], -y4[0], -1, x4[0] * y4[1], y4[0] * y4[1], y4[1]],
-            ]
-        )
-        [U, S, Vt] = np.linalg.svd(P)
-        H = Vt[-1].reshape(3, 3)
-        H /= H[2][2]
-        # see how good the matches are
-        pts = transform(src_pts, H)
-        distvec = np.sqrt(np.sum(np.square(pts - dst_pts), axis=1))
-        dist = np.mean(distvec[distvec < inlier_thr])
-        inlier = np.count_nonzero(distvec < inlier_thr)
-        if inlier > best_inlier or (inlier is best_inlier and dist < best_dist):
-            best_inlier = inlier
-            best_dist = dist
-            best_H = H
-    return best_H
+    best_H = None
+    n_iter, needed = 0, max_iter
+    while n_iter < needed:
+        size = min(batch, needed - n_iter)
+        n_iter += size
+        # pick 4 distinct random point pairs for every hypothesis
+        idx = np.random.random((size, n_pts)).argpartition(3, axis=1)[:, :4]
+        x, y = src_n[idx, 0], src_n[idx, 1]
+        u, v = dst_n[idx, 0], dst_n[idx, 1]
+        # stack the two DLT rows of every pair, (size, 8, 9)
+        zero, one = np.zeros_like(x), np.ones_like(x)
+        rows_u = np.stack([-x, -y, -one, zero, zero, zero, x * u, y * u, u], axis=-1)
+        rows_v = np.stack([zero, zero, zero, -x, -y, -one, x * v, y * v, v], axis=-1)
+        P = np.stack([rows_u, rows_v], axis=2).reshape(size, 8, 9)
+        # calculate every homography matrix with one batched SVD
+        _, _, Vt = np.linalg.svd(P)
+        H = CT2_inv @ Vt[:, -1].reshape(size, 3, 3) @ CT1
+        # see how good the matches are, all hypotheses at once
+        pts = H @ src_h
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pts = pts[:, :2] / pts[:, 2:]
+            distvec = np.sqrt(np.sum(np.square(pts - dst_pts.T), axis=1))
+        inliers = distvec < inlier_thr
+        inlier = np.count_nonzero(inliers, axis=1)
+        dist = np.sum(np.where(inliers, distvec, 0), axis=1) / np.maximum(inlier, 1)
+        # most inliers first, then the smallest mean distance among them
+        i = np.lexsort((dist, -inlier))[0]
+        if inlier[i] > best_inlier or (
+            inlier[i] == best_inlier and dist[i] < best_dist
+        ):
+            best_inlier = inlier[i]
+            best_dist = dist[i]
+            best_H = H[i]
+            # adaptive stopping, fewer iterations as the inlier ratio improves
+            needed = ransac_iterations(best_inlier / n_pts, confidence, max_iter)
+    return best_H / best_H[2][2]
 
 
 ################################################################################
@@ -319,31 +359,45 @@ def check_limits(pts, size):
 ################################################################################
 
 
-def warpImage(img, H):
+def warpImage(img, H, tile=WARP_TILE):
+    # cv.remap can not write more than SHRT_MAX rows or columns at once
+    assert 0 < tile < 2**15 - 1
     # tweak the homography matrix to move the result to the first quadrant
     H_cover, pos = coverH(size2rect(img.shape), H)
     # find the bounding box of the output
     x, y, w, h = warpRect(size2rect(img.shape), H_cover)
     width, height = x + w, y + h
-    assert width * height < 1e8  # do not exceed 300 MB for 8 GB RAM
-    # warp the image using the corrected homography matrix
-    # all the fuss is because of the indexing conventions of numpy and cv2
-    # warped = cv.warpPerspective(img, H_corr, (width, height))
-    idx_pts = np.mgrid[0:width, 0:height].reshape(2, -1).T
-    map_pts = transform(idx_pts, np.linalg.inv(H_cover))
-    map_pts = map_pts.reshape(width, height, 2).astype(np.float32)
-    warped = cv.remap(img, map_pts, None, cv.INTER_CUBIC).transpose(1, 0, 2)
-    # make the external boundary solid black, useful for masking
-    warped = np.ascontiguousarray(warped, dtype=np.uint8)
-    gray = cv.cvtColor(warped, cv.COLOR_RGB2GRAY)
-    _, bw = cv.threshold(gray, 1, 255, cv.THRESH_BINARY)
-    # https://stackoverflow.com/a/55806272/12447766
-    major = cv.__version__.split(".")[0]
-    if major == "3":
-        _, cnts, _ = cv.findContours(bw, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
-    else:
-        cnts, _ = cv.findContours(bw, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
-    warped = cv.drawContours(warped, cnts, 0, [0, 0, 0], lineType=cv.LINE_4)
+    # the output itself is the only allocation growing with the homography
+    assert (
+        width * height < WARP_MAX_PIXELS
+    ), "warped image of %dx%d pixels is too large, check the homography" % (
+        width,
+        height,
+    )
+    warped = np.zeros((height, width) + img.shape[2:], dtype=np.uint8)
+    # inverse map of the bounding box only, a tile at a time so the maps
+    # never take more than a few MB
+    Hi = np.linalg.inv(H_cover).astype(np.float32)
+    for top in range(y, height, tile):
+        bottom = min(top + tile, height)
+        rows = np.arange(top, bottom, dtype=np.float32)[:, None]
+        for left in range(x, width, tile):
+            right = min(left + tile, width)
+            cols = np.arange(left, right, dtype=np.float32)
+            # already in (row, col) order as cv.remap expects it
+            den = Hi[2, 0] * cols + Hi[2, 1] * rows + Hi[2, 2]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                map_x = (Hi[0, 0] * cols + Hi[0, 1] * rows + Hi[0, 2]) / den
+                map_y = (Hi[1, 0] * cols + Hi[1, 1] * rows + Hi[1, 2]) / den
+            out = cv.remap(
+                img, map_x, map_y, cv.INTER_CUBIC, borderMode=cv.BORDER_REPLICATE
+            )
+            # pixels inside the warped quad are the ones mapping into the image,
+            # outside it stays solid black, useful for masking
+            inside = (den > 0) & (map_x >= 0) & (map_y >= 0)
+            inside &= (map_x <= img.shape[1] - 1) & (map_y <= img.shape[0] - 1)
+            out[~inside] = 0
+            warped[top:bottom, left:right] = out
     return (warped, pos)
 
 
@@ -959,23 +1013,13 @@ def task_normalized_points(id_from, id_to):
     img2 = imgs[id_to]
     pts1 = points[id_from][id_to][0]
     pts2 = points[id_from][id_to][1]
-    # normalize the points
-    mean1 = np.mean(pts1, axis=0)
-    var1 = pts1 - mean1
-    coef1 = np.sqrt(2) / np.mean(np.sqrt(np.sum(np.square(var1), axis=1)))
-    pts1_n = coef1 * var1  # average distance: sqrt(2)
-    mean2 = np.mean(pts2, axis=0)
-    var2 = pts2 - mean2
-    coef2 = np.sqrt(2) / np.mean(np.sqrt(np.sum(np.square(var2), axis=1)))
-    pts2_n = coef2 * var2  # average distance: sqrt(2)
+    # normalize the points, average distance: sqrt(2)
+    pts1_n, CT1 = normalize_points(pts1)
+    pts2_n, CT2 = normalize_points(pts2)
     # calculate the effects of normalization on homography matrix
     # C2 * T2 * pts2 = H_n * C1 * T1 * pts1
-    T1 = np.array([[1, 0, -mean1[0]], [0, 1, -mean1[1]], [0, 0, 1]])
-    C1 = np.array([[coef1, 0, 0], [0, coef1, 0], [0, 0, 1]])
     H_n = computeH(pts1_n, pts2_n, inlier_thr=0.1)
-    T2 = np.array([[1, 0, -mean2[0]], [0, 1, -mean2[1]], [0, 0, 1]])
-    C2 = np.array([[coef2, 0, 0], [0, coef2, 0], [0, 0, 1]])
-    H_n_eff = np.linalg.inv(C2.dot(T2)).dot(H_n.dot(C1.dot(T1)))
+    H_n_eff = np.linalg.inv(CT2).dot(H_n.dot(CT1))
     # warp image
     H = computeH(pts1, pts2)
     warped, _ = blend_images(img1, img2, H)